@@ -0,0 +1,234 @@
+#!/usr/bin/python
+
+# Batch runner
+# Solves many instance files on a pool of worker processes and writes one
+# JSON line per instance to stdout as soon as it is solved (so the order is
+# the order they finish in, not the input order):
+#   {"file", "problem", "status", "objective", "solution", "runtime"}
+# plus "customers" for facility instances and "error" for failed ones.
+# status is 'ok', 'timeout', 'error' or 'crashed' (the worker died).
+#
+# The arguments are instance files, directories of them, or manifests (a
+# file with a .manifest or .lst extension) with one instance per line:
+#   [problem] <file> [<customer file>]
+# where the problem is knapsack, tsp, vrp or facility; blank lines and
+# lines starting with # are skipped and paths are relative to the manifest.
+# The problem of a file without one is found from its format (the numbers
+# on the header line and on the first row, see loader.py). A directory with
+# exactly one facility file and one customer file is run as one facility
+# instance; otherwise facility instances must be listed in a manifest.
+#
+# Each instance is run with jobs.solve under the time limit, in a worker
+# with a private working directory, so a slow or failing instance only
+# affects its own line. The workers are a jobs.WorkerPool: a worker that
+# dies, or is still running deadline_grace seconds after the time limit
+# (e.g. stuck in native code, where the alarm cannot stop it), is killed and
+# replaced, and its instance is reported as 'crashed' or 'timeout'.
+#
+# Usage: python batch.py [--workers N] [--time-limit S] path [path ...]
+
+import json
+import multiprocessing
+import os
+import Queue
+import shutil
+import signal
+import sys
+import tempfile
+
+import cache
+import jobs
+import loader
+
+# Header and row sizes of the instance files, and the problem (or facility
+# file part) they belong to
+file_kinds = {
+    (2, 2): 'knapsack',
+    (1, 2): 'tsp',
+    (3, 3): 'vrp',
+    (1, 4): 'facility',
+    (1, 3): 'customers',
+}
+
+manifest_extensions = ('.manifest', '.lst')
+
+# Time a worker may run past the time limit before it is killed
+deadline_grace = 5.
+
+# Result cache of a worker process, set by worker_init
+worker_cache = []
+
+def file_kind(path):
+    # The entry of file_kinds matching the first two lines of the file, or
+    # None for a file that is not an instance
+    try:
+        data_file = open(path, 'r')
+        lines = [data_file.readline(), data_file.readline()]
+        data_file.close()
+    except IOError:
+        return None
+    try:
+        [float(v) for v in lines[0].split() + lines[1].split()]
+    except ValueError:
+        return None
+    return file_kinds.get((len(lines[0].split()), len(lines[1].split())))
+
+def read_manifest(path):
+    # List of (problem, files) of the manifest
+    base = os.path.dirname(os.path.abspath(path))
+    instances = []
+    manifest_file = open(path, 'r')
+    for number, line in enumerate(manifest_file):
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+        problem = None
+        if fields[0] in jobs.problems:
+            problem = fields.pop(0)
+        files = [os.path.join(base, f) for f in fields]
+        if problem is None and files:
+            problem = file_kind(files[0])
+        if problem == 'facility' and len(files) != 2:
+            raise ValueError('%s line %d: a facility instance needs a facility and a customer file'
+                             % (path, number + 1))
+        if problem not in jobs.problems or len(files) != (2 if problem == 'facility' else 1):
+            raise ValueError('%s line %d: not an instance: %s' % (path, number + 1, line.strip()))
+        instances.append((problem, files))
+    manifest_file.close()
+    return instances
+
+def scan_directory(path):
+    # List of (problem, files) of the instance files in the directory
+    instances = []
+    facility_files = []
+    customer_files = []
+    for name in sorted(os.listdir(path)):
+        file_path = os.path.join(path, name)
+        if not os.path.isfile(file_path):
+            continue
+        kind = file_kind(file_path)
+        if kind == 'facility':
+            facility_files.append(file_path)
+        elif kind == 'customers':
+            customer_files.append(file_path)
+        elif kind is not None:
+            instances.append((kind, [file_path]))
+    if len(facility_files) == 1 and len(customer_files) == 1:
+        instances.append(('facility', facility_files + customer_files))
+    elif facility_files or customer_files:
+        sys.stderr.write('Skipping the facility files in %s: list them in a manifest\n' % path)
+    return instances
+
+def find_instances(paths, problem=None):
+    # Paths are made absolute, as the workers run in their own directories
+    instances = []
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            instances.extend(scan_directory(path))
+        elif path.endswith(manifest_extensions):
+            instances.extend(read_manifest(path))
+        else:
+            kind = problem or file_kind(path)
+            if kind not in jobs.problems or kind == 'facility':
+                raise ValueError('Not a knapsack, tsp or vrp instance: ' + path
+                                 + ' (list facility instances in a manifest)')
+            instances.append((kind, [path]))
+    if problem is not None:
+        instances = [(p, files) for p, files in instances if p == problem]
+    return instances
+
+def worker_init(workroot, cache_dir=None, cache_bytes=None):
+    # Runs once in each worker process (see jobs.worker_setup)
+    jobs.worker_setup(workroot)
+    if cache_dir is not None:
+        worker_cache.append(cache.ResultCache(cache_dir, cache_bytes))
+
+def run_instance(job):
+    # Runs in a worker: load and solve one instance
+    problem, files, time_limit = job
+    try:
+        parts = [loader.load_instance(f, nhead, ncols) for f, (nhead, ncols) in zip(files, cache.formats[problem])]
+    except Exception as e:
+        result = {'problem': problem, 'status': 'error', 'objective': None, 'solution': None,
+                  'runtime': 0., 'error': repr(e)}
+    else:
+        if problem == 'facility':
+            instance = tuple(parts)
+        else:
+            instance = parts[0]
+        if worker_cache:
+            result = cache.cached_solve(problem, instance, time_limit, cache=worker_cache[0])
+        else:
+            result = jobs.solve(problem, instance, time_limit)
+    result['file'] = files[0]
+    if problem == 'facility':
+        result['customers'] = files[1]
+    return result
+
+def failed(problem, files):
+    # Result of an instance whose worker was lost, for WorkerPool.submit
+    def failure(status, error, runtime):
+        result = {'problem': problem, 'status': status, 'objective': None, 'solution': None,
+                  'runtime': runtime, 'error': error, 'file': files[0]}
+        if problem == 'facility':
+            result['customers'] = files[1]
+        return result
+    return failure
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Solve many instances on a pool of processes.')
+    parser.add_argument('paths', nargs='+', help='instance files, directories or manifests')
+    parser.add_argument('--problem', choices=jobs.problems, default=None,
+                        help='only run instances of this problem (and read files as this problem)')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='worker processes (default: number of cores)')
+    parser.add_argument('--time-limit', type=float, default=None, help='seconds per instance (default: none)')
+    parser.add_argument('--no-solution', action='store_true', help='leave the solutions out of the output')
+    parser.add_argument('--cache', default=None, metavar='DIR', help='keep results in a result cache in DIR')
+    parser.add_argument('--cache-bytes', type=int, default=cache.default_max_bytes,
+                        help='size limit of the result cache (default: %d)' % cache.default_max_bytes)
+    args = parser.parse_args()
+
+    try:
+        instances = find_instances(args.paths, args.problem)
+    except (ValueError, IOError, OSError) as e:
+        parser.error(str(e))
+    if not instances:
+        parser.error('no instances found')
+
+    workroot = tempfile.mkdtemp(prefix='batch')
+    workers = max(1, min(args.workers, len(instances)))
+    pool = jobs.WorkerPool(workers, worker_init, (workroot, args.cache, args.cache_bytes), deadline_grace)
+    # Clean up on SIGTERM too (the workers reset it to the default)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    errors = 0
+    try:
+        # One instance per task, so a long instance does not hold up others
+        results = Queue.Queue()
+        for problem, files in instances:
+            pool.submit(run_instance, ((problem, files, args.time_limit),), results.put, failed(problem, files),
+                        time_limit=args.time_limit)
+        for count in range(len(instances)):
+            while True:
+                # Wait with a timeout: an untimed wait would block SIGTERM
+                try:
+                    result = results.get(timeout=1.)
+                    break
+                except Queue.Empty:
+                    continue
+            if result['status'] in ('error', 'crashed'):
+                errors += 1
+            if args.no_solution:
+                result.pop('solution', None)
+            sys.stdout.write(json.dumps(result, sort_keys=True) + '\n')
+            sys.stdout.flush()
+    finally:
+        pool.terminate()
+        shutil.rmtree(workroot, ignore_errors=True)
+    if errors:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
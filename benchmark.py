@@ -0,0 +1,331 @@
+#!/usr/bin/python
+
+# Benchmark suite for the four solvers
+# Instances are made by seeded generators in the same text formats as the
+# sample files, from toy sizes up to 100k+ items, points or customers:
+#   knapsack: uncorrelated and strongly correlated items
+#   tsp, vrp: uniform and clustered Euclidean points
+#   facility: capacitated facilities and customers
+# Each case runs solve_it in its own process with a time limit and
+# records wall time, peak memory, moves (or nodes, or states) per second
+# and the time to reach 5%, 1% and 0% of the best objective found in the
+# run (and, for knapsack, the solver that solve_it chose). The report
+# is JSON with one record per case in a fixed order, so reports of two
+# versions can be diffed.
+#
+# Usage: python benchmark.py [options], see python benchmark.py --help
+
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import time
+
+import numpy
+
+root = os.path.dirname(os.path.abspath(__file__))
+for problem in ['knapsack', 'tsp', 'facility', 'vrp']:
+    sys.path.insert(0, os.path.join(root, problem))
+import jobs
+import loader
+
+sizes = {
+    'knapsack': [20, 200, 2000, 100000],
+    'tsp': [50, 1000, 10000, 100000],
+    'vrp': [21, 200, 2000, 100000],
+    'facility': [100, 1000, 10000, 100000], # customers; facilities are n/10
+}
+kinds = {
+    'knapsack': ['uncorrelated', 'correlated'],
+    'tsp': ['uniform', 'clustered'],
+    'vrp': ['uniform', 'clustered'],
+    'facility': ['uniform'],
+}
+
+# Generators
+# Each returns the instance text (facility returns facility and customer
+# text).
+
+def gen_points(rng, n, kind, scale=1.e6):
+    # Integer coordinates, uniform in a square or in n/100 gaussian clusters
+    if kind == 'clustered':
+        k = max(1, n // 100)
+        centers = rng.uniform(0., scale, (k, 2))
+        xy = centers[rng.randint(0, k, n)] + rng.normal(0., scale / (4. * math.sqrt(k)), (n, 2))
+        xy = numpy.clip(xy, 0., scale)
+    else:
+        xy = rng.uniform(0., scale, (n, 2))
+    return numpy.floor(xy).astype(int)
+
+def gen_knapsack(n, seed=0, kind='uncorrelated', r=10000):
+    # Uncorrelated: values and weights uniform in 1..r. Strongly
+    # correlated: v_i = w_i + r/10, the hard case for the linear bound.
+    # The capacity is half of the total weight.
+    rng = numpy.random.RandomState(seed)
+    weight = rng.randint(1, r+1, n)
+    if kind == 'correlated':
+        value = weight + r // 10
+    else:
+        value = rng.randint(1, r+1, n)
+    lines = ['%d %d' % (n, weight.sum() // 2)]
+    lines.extend('%d %d' % vw for vw in zip(value.tolist(), weight.tolist()))
+    return '\n'.join(lines) + '\n'
+
+def gen_tsp(n, seed=0, kind='uniform'):
+    rng = numpy.random.RandomState(seed)
+    xy = gen_points(rng, n, kind)
+    lines = ['%d' % n]
+    lines.extend('%d %d' % tuple(p) for p in xy.tolist())
+    return '\n'.join(lines) + '\n'
+
+def gen_vrp(n, seed=0, kind='uniform', vehicle_capacity=200):
+    # Location 0 is the depot in the middle. Demands are 1..30 and there
+    # are about 30% more vehicles than the total demand needs.
+    rng = numpy.random.RandomState(seed)
+    xy = gen_points(rng, n, kind)
+    xy[0] = [500000, 500000]
+    demand = rng.randint(1, 31, n)
+    demand[0] = 0
+    vehicle_count = int(math.ceil(1.3 * demand.sum() / vehicle_capacity)) + 1
+    lines = ['%d %d %d' % (n, vehicle_count, vehicle_capacity)]
+    lines.extend('%d %d %d' % (d, p[0], p[1]) for d, p in zip(demand.tolist(), xy.tolist()))
+    return '\n'.join(lines) + '\n'
+
+def gen_facility(n, seed=0, kind='uniform'):
+    # n customers and n/10 facilities. Demands are 1..100; the total
+    # capacity is about three times the total demand.
+    rng = numpy.random.RandomState(seed)
+    nf = max(2, n // 10)
+    demand = rng.randint(1, 101, n)
+    capacity = rng.randint(1, 101, nf)
+    capacity = capacity * (3 * demand.sum()) // capacity.sum() + 1
+    setup_cost = rng.uniform(1.e4, 1.e5, nf)
+    fxy = rng.uniform(0., 2.e5, (nf, 2))
+    cxy = rng.uniform(0., 2.e5, (n, 2))
+    flines = ['%d' % nf]
+    flines.extend('%f %d %f %f' % (s, c, p[0], p[1]) for s, c, p in zip(setup_cost.tolist(), capacity.tolist(), fxy.tolist()))
+    clines = ['%d' % n]
+    clines.extend('%d %f %f' % (d, p[0], p[1]) for d, p in zip(demand.tolist(), cxy.tolist()))
+    return '\n'.join(flines) + '\n', '\n'.join(clines) + '\n'
+
+generators = {
+    'knapsack': gen_knapsack,
+    'tsp': gen_tsp,
+    'vrp': gen_vrp,
+    'facility': gen_facility,
+}
+
+# Move rates
+# Moves (or nodes) per second of the inner step of each solver, timed on a
+# fixed number of steps so the rate does not depend on the time limit.
+
+def tsp_rate(instance, nmove=100000):
+    import tsp
+    header, data = loader.parse_instance(instance, 1, 2)
+    x = data[:, 0].tolist()
+    y = data[:, 1].tolist()
+    solution = range(header[0])
+    obj = sum(tsp.length(x, y, solution[i-1], solution[i]) for i in solution)
+    start = time.time()
+    for i in range(nmove):
+        obj = tsp.rand_swap(solution, x, y, obj, 1.)
+    return nmove / (time.time() - start)
+
+def vrp_rate(instance, nmove=20000):
+    import vrp
+    vehicle_count, vehicle_capacity, demand, x, y = vrp.read_vrp(instance)
+    dist = vrp.dist_matrix(x, y)
+    vehicle_t = vrp.sweep_init(dist, demand, x, y, vehicle_count, vehicle_capacity, starts=1)
+    if vehicle_t is None:
+        return None
+    obj = vrp.tour_length(vehicle_t, dist)
+    start = time.time()
+    for i in range(nmove):
+        obj = vrp.rand_move(vehicle_t, dist, demand, vehicle_count, vehicle_capacity, obj, 1.)
+    return nmove / (time.time() - start)
+
+# Running a case
+
+def peak_memory():
+    # Peak resident memory of this process in kB (Linux reports kB)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run_case(problem, instance, time_limit, workdir, queue):
+    # Runs in a child process. Every improvement is sent on the queue as
+    # ('trace', elapsed, objective, peak_memory) right away, so the parent
+    # keeps the trace if the case is stopped at the time limit.
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1) # the solvers print their progress
+    os.chdir(workdir)
+    random.seed(0)
+    numpy.random.seed(0)
+    try:
+        if problem == 'tsp':
+            queue.put(('rate', tsp_rate(instance), None, peak_memory()))
+        elif problem == 'vrp':
+            queue.put(('rate', vrp_rate(instance), None, peak_memory()))
+        start = time.time()
+
+        def callback(solution, obj):
+            queue.put(('trace', time.time() - start, float(obj), peak_memory()))
+
+        if problem == 'knapsack':
+            import knapsack
+            # Count branch and bound nodes; depthfirst returns the best
+            # value so far, so improvements are seen on the way out. The
+            # rate is sent every 100000 nodes in case of a timeout. Large
+            # capacities go to solve_pareto, whose rate is in frontier
+            # states per second, sent with each improvement.
+            depthfirst = knapsack.depthfirst
+            count = [0, 0]
+            def counting_depthfirst(*args):
+                count[0] += 1
+                if count[0] % 100000 == 0:
+                    queue.put(('rate', count[0] / max(time.time() - start, 1.e-9), None, peak_memory()))
+                maxvalue = depthfirst(*args)
+                if maxvalue > count[1]:
+                    count[1] = maxvalue
+                    callback(None, maxvalue)
+                return maxvalue
+            knapsack.depthfirst = counting_depthfirst
+            stats = {}
+            def pareto_callback(solution, obj):
+                callback(solution, obj)
+                queue.put(('solver', stats['solver'], None, peak_memory()))
+                queue.put(('rate', stats['states'] / max(time.time() - start, 1.e-9), None, peak_memory()))
+            result = knapsack.solve_it(instance, callback=pareto_callback, stats=stats)
+            elapsed = time.time() - start
+            if stats['solver'] == 'pareto':
+                count[0] = stats['states']
+            queue.put(('solver', stats['solver'], None, peak_memory()))
+            queue.put(('rate', count[0] / max(elapsed, 1.e-9), None, peak_memory()))
+        elif problem == 'tsp':
+            import tsp
+            result = tsp.solve_it(instance, callback=callback)
+        elif problem == 'vrp':
+            import vrp
+            # Leave a margin to print and return the routes
+            result = vrp.solve_it(instance, time_limit=0.9 * time_limit, callback=callback)
+        else:
+            import facility
+            result = facility.solve_it(*instance)
+        queue.put(('done', time.time() - start, float(result[0]), peak_memory()))
+    except BaseException as e:
+        queue.put(('error', repr(e), None, peak_memory()))
+
+def time_to_quality(trace, sense):
+    # Seconds to get within 5%, 1% and 0% of the best objective of the run
+    if len(trace) == 0:
+        return None
+    best = min(obj for t, obj in trace) if sense == 'min' else max(obj for t, obj in trace)
+    result = {}
+    for name, gap in [('5%', 0.05), ('1%', 0.01), ('0%', 0.)]:
+        for t, obj in trace:
+            if (sense == 'min' and obj <= best + gap * abs(best)) or \
+               (sense == 'max' and obj >= best - gap * abs(best)):
+                result[name] = round(t, 3)
+                break
+    return result
+
+def bench_case(problem, kind, n, seed, time_limit):
+    gen_start = time.time()
+    instance = generators[problem](n, seed, kind)
+    gen_time = time.time() - gen_start
+
+    if problem == 'facility':
+        workdir = jobs.facility_workdir()
+    else:
+        workdir = os.path.join(root, problem)
+    queue = multiprocessing.Queue()
+    child = multiprocessing.Process(target=run_case, args=(problem, instance, time_limit, workdir, queue))
+    start = time.time()
+    child.start()
+    trace = []
+    record = {'problem': problem, 'kind': kind, 'n': n, 'seed': seed,
+              'status': 'timeout', 'objective': None, 'rate': None, 'peak_memory_kb': None,
+              'generate_time': round(gen_time, 3)}
+    # Read the queue until the child is done or the time limit is up
+    while True:
+        remaining = start + time_limit - time.time()
+        try:
+            msg = queue.get(timeout=min(max(remaining, 0.01), 0.1))
+        except Exception: # Queue.Empty
+            if not child.is_alive() or remaining <= 0:
+                break
+            continue
+        kind_msg, value, obj, mem = msg
+        record['peak_memory_kb'] = max(record['peak_memory_kb'], mem)
+        if kind_msg == 'rate':
+            record['rate'] = None if value is None else round(value, 1)
+        elif kind_msg == 'solver':
+            record['solver'] = value
+        elif kind_msg == 'trace':
+            trace.append((value, obj))
+        elif kind_msg == 'done':
+            record['status'] = 'ok'
+            record['objective'] = obj
+            trace.append((value, obj))
+            break
+        else:
+            record['status'] = 'error'
+            record['error'] = value
+            break
+    record['wall_time'] = round(time.time() - start, 3)
+    if child.is_alive():
+        child.terminate()
+    child.join()
+    if problem == 'facility':
+        shutil.rmtree(workdir, ignore_errors=True)
+    if record['status'] == 'timeout' and child.exitcode not in (None, 0, -15):
+        record['status'] = 'crashed'
+        record['exitcode'] = child.exitcode
+    sense = 'max' if problem == 'knapsack' else 'min'
+    if record['objective'] is None and len(trace) > 0:
+        record['objective'] = (max if sense == 'max' else min)(obj for t, obj in trace)
+    record['time_to_quality'] = time_to_quality(trace, sense)
+    return record
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark the solvers on generated instances.')
+    parser.add_argument('--problems', default='knapsack,tsp,vrp,facility',
+                        help='comma separated problems (default: all four)')
+    parser.add_argument('--sizes', default=None,
+                        help='comma separated sizes for all problems (default: toy to 100k per problem)')
+    parser.add_argument('--seeds', default='0', help='comma separated seeds (default: 0)')
+    parser.add_argument('--time-limit', type=float, default=60., help='seconds per case (default: 60)')
+    parser.add_argument('--output', default=None, help='JSON report file (default: stdout)')
+    args = parser.parse_args()
+
+    records = []
+    for problem in args.problems.split(','):
+        case_sizes = sizes[problem] if args.sizes is None else [int(n) for n in args.sizes.split(',')]
+        for kind in kinds[problem]:
+            for n in case_sizes:
+                for seed in [int(s) for s in args.seeds.split(',')]:
+                    record = bench_case(problem, kind, n, seed, args.time_limit)
+                    sys.stderr.write('%s %s n=%d seed=%d: %s %.1fs objective %s\n'
+                                     % (problem, kind, n, seed, record['status'], record['wall_time'], record['objective']))
+                    records.append(record)
+
+    report = {
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'time_limit': args.time_limit,
+        'cases': records,
+    }
+    text = json.dumps(report, indent=1, sort_keys=True)
+    if args.output is None:
+        print text
+    else:
+        output_file = open(args.output, 'w')
+        output_file.write(text + '\n')
+        output_file.close()
+
+if __name__ == '__main__':
+    main()
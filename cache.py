@@ -0,0 +1,239 @@
+#!/usr/bin/python
+
+# Result cache
+# Results of jobs.solve are stored on disk, keyed by a hash of the parsed
+# instance (the numbers, not the text, so spacing and number formatting do
+# not matter) and the solver parameters. A repeated instance gets the stored
+# result back at once, marked 'cached', if the stored solve finished ('ok')
+# and had at least the time of the new one: knapsack and facility results
+# that finished are optimal, while an annealer result is only as good as its
+# time budget, so a result of a shorter (or timed out) solve is used as the
+# seed of a new solve instead, and is replaced only by a better result.
+#
+# Instances that differ only slightly from a cached one (same counts, most
+# rows equal) are seeded with its solution: the knapsack search starts with
+# the cached items as its incumbent, and the annealers start from the cached
+# tour or routes. The solvers only use a seed if it is feasible for the new
+# instance, so a seed can make a solve faster but never wrong.
+#
+# Entries are JSON files in one directory per family (problem and counts).
+# Using an entry touches it (scanning for similar entries does not), and the
+# least recently used entries are removed when the cache grows past
+# max_bytes.
+
+import hashlib
+import json
+import os
+import time
+import zlib
+
+import numpy
+
+import jobs
+import loader
+
+default_dir = os.environ.get('DISOPT_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'disopt'))
+default_max_bytes = 256 * 2**20
+
+# Problems whose finished ('ok') results are optimal whatever their budget
+exact_problems = ('knapsack', 'facility')
+
+# Rows sampled for the fingerprint that finds similar instances, and the
+# fraction of them that must be equal
+fingerprint_rows = 256
+near_match = 0.5
+
+# Header and row sizes of each instance file of a problem
+formats = {
+    'knapsack': [(2, 2)],
+    'tsp': [(1, 2)],
+    'vrp': [(3, 3)],
+    'facility': [(1, 4), (1, 3)],
+}
+
+def parse(problem, instance):
+    # Return the (header, rows) arrays of each file of the instance
+    if problem not in formats:
+        raise ValueError('Unknown problem ' + repr(problem))
+    if problem == 'facility':
+        texts = instance
+    else:
+        texts = [instance]
+    return [loader.instance_arrays(text, nhead, ncols) for text, (nhead, ncols) in zip(texts, formats[problem])]
+
+def instance_key(problem, parts, params=None):
+    h = hashlib.sha1(problem)
+    for header, data in parts:
+        h.update(json.dumps(header))
+        h.update(numpy.ascontiguousarray(data, dtype=numpy.float64).tostring())
+    h.update(json.dumps(params or {}, sort_keys=True))
+    return h.hexdigest()
+
+def family(problem, parts):
+    return '-'.join([problem] + [str(header[0]) for header, data in parts])
+
+def better(problem, a, b):
+    # Whether objective a is better than b (knapsack maximizes)
+    if problem == 'knapsack':
+        return a > b
+    return a < b
+
+def covers(budget, time_limit):
+    # Whether a solve with time budget budget had at least time_limit
+    # (None is no limit)
+    return budget is None or (time_limit is not None and budget >= time_limit)
+
+def fingerprint(parts):
+    # CRC of evenly spaced rows of all files
+    crcs = []
+    for header, data in parts:
+        n = len(data)
+        for i in sorted(set(numpy.linspace(0, n-1, min(n, fingerprint_rows)).astype(int).tolist())):
+            crcs.append(zlib.crc32(data[i].tostring()))
+    return crcs
+
+class ResultCache(object):
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or default_dir
+        self.max_bytes = default_max_bytes if max_bytes is None else max_bytes
+
+    def path(self, fam, key):
+        return os.path.join(self.directory, fam, key + '.json')
+
+    def read(self, path, touch=True):
+        try:
+            entry_file = open(path, 'r')
+            entry = json.load(entry_file)
+            entry_file.close()
+        except (IOError, ValueError):
+            return None
+        if touch:
+            self.touch(path)
+        return entry
+
+    def touch(self, path):
+        try:
+            os.utime(path, None) # mark as recently used
+        except OSError:
+            pass
+
+    def get(self, fam, key):
+        return self.read(self.path(fam, key))
+
+    def near(self, fam, crcs, limit=20):
+        # The most recently used entry of the family whose fingerprint
+        # matches in at least near_match of the rows, or None. Only the
+        # entry returned is touched, so a scan keeps the LRU order.
+        family_dir = os.path.join(self.directory, fam)
+        try:
+            names = os.listdir(family_dir)
+        except OSError:
+            return None
+        paths = [os.path.join(family_dir, name) for name in names if name.endswith('.json')]
+        paths.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0, reverse=True)
+        for path in paths[:limit]:
+            entry = self.read(path, touch=False)
+            if entry is None or len(entry['fingerprint']) != len(crcs):
+                continue
+            same = sum(1 for a, b in zip(entry['fingerprint'], crcs) if a == b)
+            if same >= near_match * len(crcs):
+                self.touch(path)
+                return entry
+        return None
+
+    def put(self, fam, key, entry):
+        # Store entry, written to a temporary file and renamed so readers
+        # never see a partial entry
+        path = self.path(fam, key)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError: # made by another process meanwhile
+                pass
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        entry_file = open(tmp_path, 'w')
+        json.dump(entry, entry_file)
+        entry_file.close()
+        os.rename(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        # Remove the least recently used entries until the cache fits. The
+        # .tmp files of other writers are left alone (and not counted).
+        entries = []
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for name in filenames:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+def cached_solve(problem, instance, time_limit=None, params=None, cache=None, seed=True):
+    # jobs.solve with the cache in front. params are the solver parameters
+    # that are part of the key. With seed, a similar cached instance seeds
+    # the solve.
+    if cache is None:
+        cache = ResultCache()
+    start = time.time()
+    try:
+        parts = parse(problem, instance)
+    except Exception:
+        return jobs.solve(problem, instance, time_limit) # reports the error
+    fam = family(problem, parts)
+    key = instance_key(problem, parts, params)
+
+    entry = cache.get(fam, key)
+    if entry is not None and entry['result']['status'] == 'ok' and \
+            (problem in exact_problems or covers(entry.get('budget', 0), time_limit)):
+        result = entry['result']
+        result.pop('seeded', None)
+        result['cached'] = True
+        result['runtime'] = round(time.time() - start, 6)
+        return result
+
+    crcs = fingerprint(parts)
+    init = None
+    if entry is not None:
+        init = entry['result']['solution'] # same instance, less time
+    elif seed:
+        near_entry = cache.near(fam, crcs)
+        if near_entry is not None:
+            init = near_entry['result']['solution']
+    budget = time_limit
+    if time_limit is not None:
+        time_limit -= time.time() - start
+    if problem == 'facility':
+        arrays = tuple(parts)
+    else:
+        arrays = parts[0]
+    result = jobs.solve(problem, arrays, time_limit, seed=init)
+    result['seeded'] = init is not None
+    if result['status'] not in ('ok', 'timeout') or result['solution'] is None:
+        return result
+    if entry is not None:
+        # Keep the better solution, with the longer budget of the two
+        if budget is not None and entry.get('budget', 0) is not None:
+            budget = max(budget, entry.get('budget', 0))
+        else:
+            budget = None
+        if not better(problem, result['objective'], entry['result']['objective']):
+            result['objective'] = entry['result']['objective']
+            result['solution'] = entry['result']['solution']
+    cache.put(fam, key, {'problem': problem, 'params': params or {}, 'fingerprint': crcs,
+                         'budget': budget, 'result': result})
+    return result
@@ -11,15 +11,17 @@
 
 # I use SCIP MIP solver (http://scip.zib.de) to find the solution
 
+import os
+import sys
 from collections import namedtuple
-import math
 
-Point = namedtuple("Point", ['x', 'y'])
-Facility = namedtuple("Facility", ['index', 'setup_cost', 'capacity', 'location'])
-Customer = namedtuple("Customer", ['index', 'demand', 'location'])
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import loader
 
-def length(point1, point2):
-    return math.sqrt((point1.x - point2.x)**2 + (point1.y - point2.y)**2)
+# Facilities and customers are kept as columns (numpy arrays), indexed by
+# facility or customer
+Facilities = namedtuple("Facilities", ['setup_cost', 'capacity', 'x', 'y'])
+Customers = namedtuple("Customers", ['demand', 'x', 'y'])
 
 import re
 
@@ -36,11 +38,10 @@ def get_sol(optdata,c_count):
         if parts != []:
             if parts[0][0] == 'x':
                 part = re.split('[x_]', parts[0]) # edges[0] = ''
-                sol_data.append(part[2])
+                sol_data.append((int(part[1]), int(part[2]))) # customer and facility id
 
     return obj, sol_data
 
-import os
 from subprocess import Popen, PIPE
 
 import numpy
@@ -52,16 +53,12 @@ def read_facility(facility_data):
     # s_1 C_1 x_1 y_1
     # ...
     # s_N-1 C_N-1 x_N-1 y_N-1
+    # facility_data is the text or the arrays from loader.load_instance
     
-    lines = facility_data.split('\n')
-
-    facility_count = int(lines[0])
+    header, data = loader.instance_arrays(facility_data, 1, 4)
+    facility_count = header[0]
     
-    facilities = []
-    for i in range(1, facility_count+1):
-        parts = lines[i].split()
-        assert len(parts) == 4
-        facilities.append(Facility(i-1, float(parts[0]), int(parts[1]), Point(float(parts[2]), float(parts[3])) ))
+    facilities = Facilities(data[:, 0], data[:, 1].astype(int), data[:, 2], data[:, 3])
     return facility_count, facilities
 
 def read_customer(customer_data):
@@ -71,142 +68,184 @@ def read_customer(customer_data):
     # D_N+1 x_N+1 y_N+1
     # ...
     # D_N+M-1 x_N+M-1 y_N+M-1
+    # customer_data is the text or the arrays from loader.load_instance
     
-    lines = customer_data.split('\n')
-
-    customer_count = int(lines[0])
+    header, data = loader.instance_arrays(customer_data, 1, 3)
+    customer_count = header[0]
     
-    customers = []
-    for i in range(1, customer_count+1):
-        parts = lines[i].split()
-        assert len(parts) == 3
-        customers.append(Customer(i-1, int(parts[0]), Point(float(parts[1]), float(parts[2]))))
+    customers = Customers(data[:, 0].astype(int), data[:, 1], data[:, 2])
     return customer_count, customers        
 
-def solve_it(facility_data, customer_data):
-    # Read data
-    facility_count, facilities = read_facility(facility_data)
-    customer_count, customers = read_customer(customer_data)
+# Number of facilities each customer may be served by: the ones of least
+# distance plus setup cost
+n_near = 20
 
-    # Limit customers to nearest facilities
-    n_near = 20 
-    nearest_f = []
-    nearest_all = set([])
-    for customer in customers:
-        i = customer.index
-        price = []
-        for facility in facilities:
-            j = facility.index
-            dis = length(customer.location, facility.location)
-            price.append(dis+facility.setup_cost)
-        price = numpy.array(price)
-        sort_index = numpy.argsort(price)
-        nearest_f.append(list(sort_index[:n_near]))
-        nearest_all = nearest_all | set(sort_index[:n_near])
-    nearest_all = list(nearest_all)
-
-    # Construct pip file for SCIP:
-    
-    # Write objective function
-    pipdata = 'Minimize' + '\n' + '  obj: '
-    
-    for customer in customers:
-        i = customer.index
-        for j in nearest_f[i]:
-            #j = facility.index
-            dis = length(customer.location, facilities[j].location)
-            pipdata += str(dis) + ' x' + str(i) + '_' + str(j) + ' + \n' 
-    
-    for j in nearest_all[:len(nearest_all)-1]:
-        #j = facility.index
-        pipdata += str(facilities[j].setup_cost) + ' f' + str(j) + ' + \n'
-    
-    pipdata += str(facilities[nearest_all[-1]].setup_cost) + ' f' + str(nearest_all[-1]) + '\n'  
+def nearest_facilities(facilities, customers, rows=None, chunk=1000):
+    # The n_near facilities of least price (distance plus setup cost) of
+    # each customer in rows (all of them by default), as a 2D array
+    if rows is None:
+        rows = numpy.arange(len(customers.demand))
+    near = numpy.empty((len(rows), min(n_near, len(facilities.x))), dtype=numpy.int64)
+    for a in range(0, len(rows), chunk):
+        r = rows[a:a+chunk]
+        price = numpy.hypot(facilities.x[None, :] - customers.x[r, None], facilities.y[None, :] - customers.y[r, None]) \
+              + facilities.setup_cost[None, :]
+        near[a:a+chunk] = numpy.argsort(price, axis=1)[:, :n_near]
+    return near
 
-    pipdata += 'Subject to\n'
-    
-    nobj = 0 # number of constraints
-    
-    # Write constraint
-    for customer in customers:
-        i = customer.index
-        pipdata += '  c' + str(i) + ': ' 
+# The model is kept in fragments, so a re-solve (resolve_it) rewrites only
+# the parts of changed customers and facilities. Variables and rows are
+# named by ids that stay with a customer or facility when others are added
+# or removed (on the first solve, the ids are the indices):
+#   xC_F  customer C served by facility F, fF  facility F open,
+#   aC    customer C served once, lC_F  only by an open facility,
+#   kF    capacity of facility F.
+# Each customer has (objective terms, rows, binaries) and each candidate
+# facility (setup cost term, capacity row, binary).
+Model = namedtuple("Model", ['customer', 'facility'])
 
-        for j in nearest_f[i][:len(nearest_f[i])-1]:
-            #j = facility.index
-            pipdata += 'x' + str(i) + '_' + str(j) + ' + '
+def customer_model(cid, fids, dis):
+    # Fragment of customer cid with candidates fids at distances dis
+    names = ['x' + str(cid) + '_' + str(fid) for fid in fids]
+    obj = ''.join([str(d) + ' ' + name + ' + \n' for d, name in zip(dis, names)])
+    rows = ['  a' + str(cid) + ': ' + ' + '.join(names) + ' == 1\n']
+    for fid, name in zip(fids, names):
+        rows.append('  l' + name[1:] + ': ' + name + ' - f' + str(fid) + ' <= 0\n')
+    binary = ''.join([' ' + name + '\n' for name in names])
+    return obj, ''.join(rows), binary
 
-        pipdata += 'x' + str(i) + '_' + str(nearest_f[i][-1]) + ' == 1\n'
-        nobj += 1
-    
-    for customer in customers:
-        i = customer.index
-
-        for j in nearest_f[i]:
-            #j = facility.index
-            pipdata += '  c' + str(nobj) + ': '
-            pipdata += 'x' + str(i) + '_' + str(j) + ' - ' + 'f' + str(j) + ' <= 0\n'
-            nobj += 1
-
-    # Capacity constraint
-    is_first = 0
-    for j in nearest_all:
-        #j = facility.index
-        pipdata += '  c' + str(nobj) + ': '
-        for customer in customers[:customer_count-1]:
-            i = customer.index
-            if j in nearest_f[i]:
-                if is_first == 0:
-                    pipdata += str(customer.demand) + ' x' + str(i) + '_' + str(j)
-                    is_first = 1
-                else:
-                    pipdata += ' + ' + str(customer.demand) + ' x' + str(i) + '_' + str(j)
-        customer = customers[customer_count-1]
-        if j in nearest_f[customer.index]:
-            pipdata += ' + ' + str(customer.demand) + ' x' + str(customer.index) + '_' + str(j)
-        pipdata += ' <= ' + str(facilities[j].capacity) + '\n'
-        nobj += 1
-        
-    # Write bounds
-    pipdata += 'Bounds\n\n'
-    
-    # Write variable type
-    pipdata += 'Binary\n'
-    for customer in customers:
-        i = customer.index
-        for j in nearest_f[i]:
-            #j = facility.index
-            pipdata += ' x' + str(i) + '_' + str(j) + '\n'
-    
-    for j in nearest_all:    
-        pipdata += ' f' + str(j) + '\n'
-    pipdata += 'End'
-    
+def facility_model(fid, setup_cost, capacity, served):
+    # Fragment of facility fid, with served the (demand, customer id) of
+    # the customers it may serve
+    row = ' + '.join([str(d) + ' x' + str(cid) + '_' + str(fid) for d, cid in served])
+    return (str(setup_cost) + ' f' + str(fid),
+            '  k' + str(fid) + ': ' + row + ' <= ' + str(capacity) + '\n',
+            ' f' + str(fid) + '\n')
+
+def build_model(facilities, customers, nearest_f, customer_ids, facility_ids, model=None,
+                customer_rows=None, facility_rows=None):
+    # Model fragments of the instance with candidates nearest_f. Given the
+    # fragments of the previous instance, already in the new customer order
+    # (model.customer; model.facility is by id), only those of customer_rows
+    # and facility_rows (indices of the new instance) are made again.
+    customer_count = len(customers.demand)
+    if model is None:
+        customer_part = [None] * customer_count
+        facility_part = {}
+        customer_rows = numpy.arange(customer_count)
+        facility_rows = numpy.unique(nearest_f)
+    else:
+        customer_part = list(model.customer)
+        facility_part = dict(model.facility)
+    # Facilities left out of the model have no candidate customers
+    live = set(facility_ids[numpy.unique(nearest_f)].tolist())
+    for fid in facility_part.keys():
+        if fid not in live:
+            del facility_part[fid]
+
+    if len(customer_rows) > 0:
+        near = nearest_f[customer_rows]
+        dis = numpy.hypot(facilities.x[near] - customers.x[customer_rows, None],
+                          facilities.y[near] - customers.y[customer_rows, None]).tolist()
+        fids = facility_ids[near].tolist()
+        cids = customer_ids[customer_rows].tolist()
+        for k, i in enumerate(customer_rows.tolist()):
+            customer_part[i] = customer_model(cids[k], fids[k], dis[k])
+
+    if len(facility_rows) > 0:
+        # Customers that may be served by each facility, in order
+        hit = numpy.in1d(nearest_f, facility_rows).reshape(nearest_f.shape)
+        rows, cols = numpy.nonzero(hit)
+        served_f = nearest_f[rows, cols]
+        order = numpy.argsort(served_f, kind='mergesort')
+        rows = rows[order]
+        served_f = served_f[order]
+        bounds = numpy.flatnonzero(numpy.diff(served_f)) + 1
+        demand = customers.demand[rows].tolist()
+        cids = customer_ids[rows].tolist()
+        setup_cost = facilities.setup_cost.tolist()
+        capacity = facilities.capacity.tolist()
+        for a, b in zip([0] + bounds.tolist(), bounds.tolist() + [len(rows)]):
+            if a == b:
+                continue
+            j = served_f[a]
+            fid = int(facility_ids[j])
+            facility_part[fid] = facility_model(fid, setup_cost[j], capacity[j], zip(demand[a:b], cids[a:b]))
+    return Model(customer_part, facility_part)
+
+def model_text(model):
+    # Text of the MIP model for SCIP
+    facility_part = [model.facility[fid] for fid in sorted(model.facility)]
+    pipdata = ['Minimize' + '\n' + '  obj: ']
+    pipdata.extend([c[0] for c in model.customer])
+    pipdata.append(' + \n'.join([f[0] for f in facility_part]) + '\n')
+    pipdata.append('Subject to\n')
+    pipdata.extend([c[1] for c in model.customer])
+    pipdata.extend([f[1] for f in facility_part])
+    pipdata.append('Bounds\n\n')
+    pipdata.append('Binary\n')
+    pipdata.extend([c[2] for c in model.customer])
+    pipdata.extend([f[2] for f in facility_part])
+    pipdata.append('End')
+    return ''.join(pipdata)
+
+def write_pip(facilities, customers, nearest_f):
+    # Text of the MIP model for SCIP, with customer i allowed only the
+    # facilities in nearest_f[i]
+    customer_ids = numpy.arange(len(customers.demand))
+    facility_ids = numpy.arange(len(facilities.x))
+    return model_text(build_model(facilities, customers, nearest_f, customer_ids, facility_ids))
+
+def run_scip(pipdata, facility_count, customer_count, batch_file='run.batch', customer_ids=None,
+             facility_ids=None):
+    # Solve the model with SCIP, in the working directory (see run.batch).
+    # customer_ids and facility_ids are the ids in the model of each
+    # customer and facility (the indices by default).
+    # Return the objective and the customers served by each facility.
     tmp_file_name = 'tmp.pip'
     tmp_file = open(tmp_file_name, 'w')
     tmp_file.write(pipdata)
     tmp_file.close()
     
     # Run command for SCIP MIP solver
-    process = Popen(['./scip-3.1.0.darwin.x86_64.gnu.opt.spx','-b', 'run.batch'])   #, stdout=PIPE)
-    (stdout, stderr) = process.communicate()
+    process = Popen(['./scip-3.1.0.darwin.x86_64.gnu.opt.spx','-b', batch_file])   #, stdout=PIPE)
+    try:
+        (stdout, stderr) = process.communicate()
+    except BaseException:
+        # Stopped while waiting (e.g. by the job time limit): do not leave
+        # SCIP running
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        raise
 
     scip_out_file = open('tmp.sol', 'r')
     tmpout = ''.join(scip_out_file.readlines())
     scip_out_file.close()
 
     # Get solution
-    obj, solution = get_sol(tmpout,customer_count)
+    obj, solution = get_sol(tmpout, customer_count)
     
+    if customer_ids is None:
+        customer_ids = range(customer_count)
+    if facility_ids is None:
+        facility_ids = range(facility_count)
+    customer_of = dict(zip(customer_ids, range(customer_count)))
+    facility_of = dict(zip(facility_ids, range(facility_count)))
+
     served = []
     for i in range(facility_count):
         served.append([])
         
-    for i in range(len(solution)):
-        served[int(solution[i])].append(i)
-    
+    for cid, fid in solution:
+        served[facility_of[fid]].append(customer_of[cid])
+    for customers_j in served:
+        customers_j.sort()
+    return obj, served
+
+def print_served(served, customer_count, obj):
     # Print results
-    print 'Given', customer_count, 'customers to be served by', facility_count, 'facilities,'
+    print 'Given', customer_count, 'customers to be served by', len(served), 'facilities,'
     print 'to minimize cost, customers served by facilities are '
     for i in range(len(served)):
         if len(served[i]) > 0:
@@ -214,23 +253,281 @@ def solve_it(facility_data, customer_data):
     
     print
     print 'Cost:', obj
+
+def solve_it(facility_data, customer_data):
+    # Read data
+    facility_count, facilities = read_facility(facility_data)
+    customer_count, customers = read_customer(customer_data)
+
+    # Limit customers to nearest facilities
+    nearest_f = nearest_facilities(facilities, customers)
+
+    obj, served = run_scip(write_pip(facilities, customers, nearest_f), facility_count, customer_count)
+    print_served(served, customer_count, obj)
     
-    return
+    return float(obj), served
 
-import sys
+# Incremental re-optimization
+# When an instance changes a little from the last solve, resolve_it starts
+# from the plan of the last solve: the instance, the candidate facilities
+# of each customer (nearest_f) and the assignment. Given a delta
+#   {'customers':  {'remove': [i, ...], 'update': {i: (D, x, y)},
+#                   'add': [(D, x, y), ...]},
+#    'facilities': {'remove': [j, ...], 'update': {j: (s, C, x, y)},
+#                   'add': [(s, C, x, y), ...]}}
+# (indices of the last instance; removed rows are deleted and added ones
+# appended, so the others keep their order), it
+# - recomputes nearest_f only for the customers that are new or changed,
+#   lost a candidate, or for which a new or changed facility is now cheaper
+#   than their dearest candidate;
+# - keeps the previous facility of every other customer and assigns the
+#   rest greedily to the cheapest candidate with room, giving SCIP a
+#   starting solution;
+# - rewrites the model fragments (see build_model) of those customers and
+#   of the facilities they may be served by, and reuses the others;
+# - solves with a time limit, so SCIP stops with the best solution found
+#   from the start instead of proving optimality.
+# Plans are saved to and loaded from files with save_plan and load_plan, so
+# the command line can re-solve from the plan of an earlier run:
+#   python facility.py fac_data.txt cus_data.txt plan.pkl
+#   python facility.py --resolve plan.pkl delta.json [time_limit]
+# (the delta as JSON, with the customer and facility indices as strings in
+# 'update'); the re-solve replaces the plan file with the new plan.
+
+Plan = namedtuple("Plan", ['facilities', 'customers', 'nearest_f', 'assign', 'customer_ids', 'facility_ids',
+                           'model'])
+
+def make_plan(facility_data, customer_data, served):
+    # Plan of a solved instance, from the served lists of solve_it
+    facility_count, facilities = read_facility(facility_data)
+    customer_count, customers = read_customer(customer_data)
+    assign = numpy.empty(customer_count, dtype=numpy.int64)
+    assign.fill(-1)
+    for j in range(len(served)):
+        assign[served[j]] = j
+    nearest_f = nearest_facilities(facilities, customers)
+    customer_ids = numpy.arange(customer_count)
+    facility_ids = numpy.arange(facility_count)
+    return Plan(facilities, customers, nearest_f, assign, customer_ids, facility_ids,
+                build_model(facilities, customers, nearest_f, customer_ids, facility_ids))
+
+def save_plan(plan, file_name):
+    # Plain tuples and dicts only, so the file does not depend on the module
+    # that wrote it (e.g. __main__)
+    import cPickle
+    data = dict(plan._asdict())
+    data['facilities'] = tuple(plan.facilities)
+    data['customers'] = tuple(plan.customers)
+    data['model'] = tuple(plan.model)
+    plan_file = open(file_name, 'wb')
+    cPickle.dump(data, plan_file, 2)
+    plan_file.close()
+
+def load_plan(file_name):
+    import cPickle
+    plan_file = open(file_name, 'rb')
+    data = cPickle.load(plan_file)
+    plan_file.close()
+    data['facilities'] = Facilities(*data['facilities'])
+    data['customers'] = Customers(*data['customers'])
+    data['model'] = Model(*data['model'])
+    return Plan(**data)
+
+def apply_rows(columns, delta, kinds):
+    # Apply the remove/update/add of delta to the columns. Return the new
+    # columns, the new index of each old row (-1 if removed) and the new
+    # indices of the added and updated rows (the added ones last).
+    count = len(columns[0])
+    keep = numpy.ones(count, dtype=bool)
+    keep[list(delta.get('remove', []))] = False
+    columns = [numpy.array(col) for col in columns]
+    for i, row in delta.get('update', {}).items():
+        for col, value in zip(columns, row):
+            col[int(i)] = value
+    added = delta.get('add', [])
+    columns = [numpy.concatenate((col[keep], numpy.array([row[k] for row in added], dtype=col.dtype)))
+               for k, col in enumerate(columns)]
+    new_index = numpy.empty(count, dtype=numpy.int64)
+    new_index.fill(-1)
+    new_index[keep] = numpy.arange(keep.sum())
+    changed = [new_index[int(i)] for i in delta.get('update', {}) if keep[int(i)]]
+    changed.extend(range(int(keep.sum()), int(keep.sum()) + len(added)))
+    return [kind(col) for kind, col in zip(kinds, columns)], new_index, numpy.array(changed, dtype=numpy.int64)
+
+def update_nearest(plan, facilities, customers, facility_index, customer_index, changed_f, changed_c):
+    # nearest_f of the new instance, recomputing only the rows that may
+    # differ from the plan's. Return it and the recomputed rows.
+    customer_count = len(customers.demand)
+    if plan.nearest_f.shape[1] != min(n_near, len(facilities.x)): # fewer facilities than n_near
+        return nearest_facilities(facilities, customers), numpy.arange(customer_count)
+
+    # Rows of the customers that stay, with the new facility indices
+    kept = numpy.flatnonzero(customer_index >= 0)
+    nearest_f = numpy.empty((customer_count, plan.nearest_f.shape[1]), dtype=numpy.int64)
+    nearest_f[customer_index[kept]] = facility_index[plan.nearest_f[kept]]
+
+    redo = numpy.zeros(customer_count, dtype=bool)
+    redo[changed_c] = True
+    redo[customer_index[kept]] |= (nearest_f[customer_index[kept]] < 0).any(axis=1)
+    redo[customer_index[kept]] |= numpy.in1d(nearest_f[customer_index[kept]], changed_f).reshape(len(kept), -1).any(axis=1)
+    if len(changed_f) > 0:
+        # Customers for which a new or changed facility beats their dearest
+        # candidate
+        rows = numpy.flatnonzero(~redo)
+        last = nearest_f[rows, -1]
+        worst = numpy.hypot(facilities.x[last] - customers.x[rows], facilities.y[last] - customers.y[rows]) \
+              + facilities.setup_cost[last]
+        price = numpy.hypot(facilities.x[changed_f][None, :] - customers.x[rows, None],
+                            facilities.y[changed_f][None, :] - customers.y[rows, None]) \
+              + facilities.setup_cost[changed_f][None, :]
+        redo[rows] |= (price <= worst[:, None]).any(axis=1)
+
+    rows = numpy.flatnonzero(redo)
+    if len(rows) > 0:
+        nearest_f[rows] = nearest_facilities(facilities, customers, rows)
+    print 'Candidate facilities recomputed for', len(rows), 'of', customer_count, 'customers'
+    return nearest_f, rows
+
+def new_ids(ids, count):
+    # count ids not used before (above all of ids)
+    first = int(ids.max()) + 1 if len(ids) > 0 else 0
+    return numpy.arange(first, first + count)
+
+def warm_start(assign, facilities, customers, nearest_f):
+    # Feasible assignment close to assign (-1 for customers without one):
+    # keep the facilities that are still candidates while they have room,
+    # then put the other customers, largest demand first, in the cheapest
+    # candidate with room (setup cost counted if it is not open yet).
+    # Return None if some customer does not fit.
+    customer_count = len(customers.demand)
+    left = facilities.capacity.astype(numpy.int64).copy()
+    start = numpy.empty(customer_count, dtype=numpy.int64)
+    start.fill(-1)
+    for i in numpy.argsort(-customers.demand, kind='mergesort'):
+        j = assign[i]
+        if j >= 0 and j in nearest_f[i] and left[j] >= customers.demand[i]:
+            start[i] = j
+            left[j] -= customers.demand[i]
+    is_open = numpy.zeros(len(left), dtype=bool)
+    is_open[start[start >= 0]] = True
+    for i in numpy.argsort(-customers.demand, kind='mergesort'):
+        if start[i] >= 0:
+            continue
+        cand = nearest_f[i]
+        price = numpy.hypot(facilities.x[cand] - customers.x[i], facilities.y[cand] - customers.y[i]) \
+              + numpy.where(is_open[cand], 0., facilities.setup_cost[cand])
+        price[left[cand] < customers.demand[i]] = numpy.inf
+        k = price.argmin()
+        if numpy.isinf(price[k]):
+            return None
+        start[i] = cand[k]
+        left[cand[k]] -= customers.demand[i]
+        is_open[cand[k]] = True
+    return start
+
+def write_start(file_name, start, facilities, customers, customer_ids, facility_ids):
+    # Starting solution for SCIP, in its solution file format
+    used = sorted(set(start.tolist()))
+    obj = facilities.setup_cost[used].sum() \
+        + numpy.hypot(facilities.x[start] - customers.x, facilities.y[start] - customers.y).sum()
+    start_file = open(file_name, 'w')
+    start_file.write('objective value: ' + str(obj) + '\n')
+    for i in range(len(start)):
+        start_file.write('x' + str(customer_ids[i]) + '_' + str(facility_ids[start[i]]) + ' 1\n')
+    for j in used:
+        start_file.write('f' + str(facility_ids[j]) + ' 1\n')
+    start_file.close()
+
+def resolve_it(plan, delta, time_limit=60):
+    # Re-solve the plan's instance changed by delta (see above) in at most
+    # time_limit seconds of SCIP. Return the cost, the customers served by
+    # each facility, and the plan of the new instance for the next delta.
+    facility_delta = delta.get('facilities', {})
+    customer_delta = delta.get('customers', {})
+    f_cols, facility_index, changed_f = apply_rows(plan.facilities, facility_delta,
+                                                   [numpy.asarray, lambda c: c.astype(int), numpy.asarray, numpy.asarray])
+    c_cols, customer_index, changed_c = apply_rows(plan.customers, customer_delta,
+                                                   [lambda c: c.astype(int), numpy.asarray, numpy.asarray])
+    facilities = Facilities(*f_cols)
+    customers = Customers(*c_cols)
+    facility_count = len(facilities.x)
+    customer_count = len(customers.demand)
+
+    nearest_f, redo = update_nearest(plan, facilities, customers, facility_index, customer_index,
+                                     changed_f, changed_c)
+
+    # Ids of the customers and facilities that stay, then new ones
+    kept = numpy.flatnonzero(customer_index >= 0)
+    customer_ids = numpy.concatenate((plan.customer_ids[kept],
+                                      new_ids(plan.customer_ids, customer_count - len(kept))))
+    kept_f = numpy.flatnonzero(facility_index >= 0)
+    facility_ids = numpy.concatenate((plan.facility_ids[kept_f],
+                                      new_ids(plan.facility_ids, facility_count - len(kept_f))))
+
+    # Model fragments: the kept customers', then those of the recomputed
+    # customers and of the facilities whose candidate customers changed
+    old_model = Model([plan.model.customer[i] for i in kept] + [None] * (customer_count - len(kept)),
+                      plan.model.facility)
+    lost = numpy.ones(len(customer_index), dtype=bool) # removed or recomputed customers
+    lost[kept] = False
+    lost[kept[numpy.in1d(customer_index[kept], redo)]] = True
+    touched = facility_index[numpy.unique(plan.nearest_f[lost])]
+    touched = numpy.unique(numpy.concatenate((touched[touched >= 0], nearest_f[redo].ravel(), changed_f)))
+    model = build_model(facilities, customers, nearest_f, customer_ids, facility_ids, old_model, redo, touched)
+    print 'Model rewritten for', len(redo), 'customers and', len(touched), 'facilities'
+
+    # Previous facility of each customer, in the new indices
+    assign = numpy.empty(customer_count, dtype=numpy.int64)
+    assign.fill(-1)
+    old = plan.assign[kept]
+    assign[customer_index[kept]] = numpy.where(old >= 0, facility_index[old], -1)
+
+    batch = ['set limits time ' + str(time_limit), 'read tmp.pip']
+    start = warm_start(assign, facilities, customers, nearest_f)
+    if start is not None:
+        write_start('start.sol', start, facilities, customers, customer_ids, facility_ids)
+        batch.append('read start.sol')
+    batch.extend(['optimize', 'write solution tmp.sol', 'quit'])
+    batch_file = open('resolve.batch', 'w')
+    batch_file.write('\n'.join(batch) + '\n')
+    batch_file.close()
+
+    obj, served = run_scip(model_text(model), facility_count, customer_count, 'resolve.batch',
+                           customer_ids.tolist(), facility_ids.tolist())
+    print_served(served, customer_count, obj)
+
+    new_assign = numpy.empty(customer_count, dtype=numpy.int64)
+    new_assign.fill(-1)
+    for j in range(facility_count):
+        new_assign[served[j]] = j
+    return float(obj), served, Plan(facilities, customers, nearest_f, new_assign, customer_ids, facility_ids, model)
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 3 and sys.argv[1] == '--resolve':
+        # Re-solve the plan of an earlier run with a delta, and save the
+        # new plan in its place
+        import json
+        plan_filename = sys.argv[2].strip()
+        delta_file = open(sys.argv[3].strip(), 'r')
+        delta = json.load(delta_file)
+        delta_file.close()
+        time_limit = 60
+        if len(sys.argv) > 4:
+            time_limit = float(sys.argv[4])
+        print 'Re-solving...'
+        obj, served, plan = resolve_it(load_plan(plan_filename), delta, time_limit)
+        save_plan(plan, plan_filename)
+    elif len(sys.argv) > 2:
         facility_filename = sys.argv[1].strip()
         customer_filename = sys.argv[2].strip()
-        facility_data_file = open(facility_filename, 'r')
-        customer_data_file = open(customer_filename, 'r')
-        facility_data = ''.join(facility_data_file.readlines())
-        customer_data = ''.join(customer_data_file.readlines())
-        facility_data_file.close()
-        customer_data_file.close()
+        facility_data = loader.load_instance(facility_filename, 1, 4)
+        customer_data = loader.load_instance(customer_filename, 1, 3)
         print 'Solving...'
-        solve_it(facility_data, customer_data)
+        obj, served = solve_it(facility_data, customer_data)
+        if len(sys.argv) > 3:
+            # Save the plan for later re-solves
+            save_plan(make_plan(facility_data, customer_data, served), sys.argv[3].strip())
     else:
-        print 'This test requires two input files. (For example: python solver.py fac_data.txt cus_data.txt)'
+        print 'This test requires two input files. (For example: python solver.py fac_data.txt cus_data.txt [plan.pkl])'
+        print 'or a plan and a delta. (For example: python solver.py --resolve plan.pkl delta.json [time_limit])'
 
@@ -0,0 +1,301 @@
+#!/usr/bin/python
+
+# Running one solve as a job
+# solve() runs the solve_it of one of the four problems on an instance in
+# the text format and returns a result that can be written as JSON:
+#   {'problem', 'status', 'objective', 'solution', 'runtime'}
+# status is 'ok', 'timeout' or 'error'. With a time limit, the job is
+# stopped by SIGALRM when the limit is up; the annealers report their best
+# solution through their callbacks, so a stopped TSP or VRP job still
+# returns the best tour or routes found so far. The VRP solver is also
+# given the time limit itself, so it normally stops on its own.
+#
+# The alarm only works in the main thread of a process, which is where
+# the workers of WorkerPool run their tasks. WorkerPool also enforces the
+# limits from the parent: a worker that dies, or is still running some time
+# after its task's deadline, is killed and replaced and the task gets a
+# 'crashed' or 'timeout' result, so no task is ever lost.
+
+import collections
+import multiprocessing
+import os
+import select
+import signal
+import sys
+import threading
+import time
+
+root = os.path.dirname(os.path.abspath(__file__))
+problems = ['knapsack', 'tsp', 'facility', 'vrp']
+for problem in problems:
+    sys.path.insert(0, os.path.join(root, problem))
+
+class Timeout(Exception):
+    pass
+
+def alarm_handler(signum, frame):
+    raise Timeout()
+
+def facility_workdir(parent=None):
+    # Scratch directory (in parent, if given) with run.batch and links to
+    # the SCIP binaries of the facility directory. facility.py writes
+    # tmp.pip and tmp.sol in the working directory, so concurrent facility
+    # jobs need one each.
+    import glob
+    import tempfile
+    import shutil
+    workdir = tempfile.mkdtemp(prefix='facility', dir=parent)
+    shutil.copy(os.path.join(root, 'facility', 'run.batch'), workdir)
+    for scip in glob.glob(os.path.join(root, 'facility', 'scip*')):
+        os.symlink(scip, os.path.join(workdir, os.path.basename(scip)))
+    return workdir
+
+def worker_setup(workroot=None):
+    # Setup of a pool worker process: silence the solvers' progress output,
+    # work in a private directory (in workroot, if given) and import the
+    # solvers up front
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.chdir(facility_workdir(workroot))
+    import knapsack
+    import tsp
+    import vrp
+    import facility
+
+def plain(x):
+    # Convert numpy numbers (and lists of them) to Python numbers for JSON
+    if isinstance(x, (list, tuple)):
+        return [plain(e) for e in x]
+    if hasattr(x, 'item'):
+        return x.item()
+    return x
+
+def run_solver(problem, instance, time_limit, callback, seed=None, gap=None, stats=None):
+    # Call the solve_it of problem, return (objective, solution).
+    # instance is the text, or (facility text, customer text) for facility;
+    # the arrays from loader can be given instead of text.
+    # seed is an optional solution to start from (the solvers check that it
+    # is feasible); the facility solver does not use one.
+    # gap and stats are passed to the TSP solver (lower bound and gap).
+    if problem == 'knapsack':
+        import knapsack
+        return knapsack.solve_it(instance, incumbent=seed)
+    elif problem == 'tsp':
+        import tsp
+        if time_limit is not None:
+            time_limit *= 0.9 # leave a margin to return the tour
+        return tsp.solve_it(instance, callback=callback, init_tour=seed, gap=gap, stats=stats, time_limit=time_limit)
+    elif problem == 'vrp':
+        import vrp
+        if time_limit is not None:
+            time_limit *= 0.9 # leave a margin to polish and return the routes
+        return vrp.solve_it(instance, time_limit=time_limit, callback=callback, init_routes=seed)
+    elif problem == 'facility':
+        import facility
+        return facility.solve_it(*instance)
+    raise ValueError('Unknown problem ' + repr(problem))
+
+def solve(problem, instance, time_limit=None, seed=None, gap=None):
+    # With gap, a TSP job stops once its tour is within gap of the
+    # Held-Karp lower bound, and the result also has 'bound' and 'gap'.
+    start = time.time()
+    best = {}
+    stats = None
+    if gap is not None and problem == 'tsp':
+        stats = {}
+
+    def callback(solution, obj):
+        best['objective'] = obj
+        best['solution'] = solution
+
+    result = {'problem': problem, 'status': 'ok', 'objective': None, 'solution': None}
+    if time_limit is not None and time_limit <= 0:
+        result['status'] = 'timeout'
+        result['runtime'] = 0.
+        return result
+    if time_limit is not None:
+        handler = signal.signal(signal.SIGALRM, alarm_handler)
+        signal.setitimer(signal.ITIMER_REAL, time_limit)
+    try:
+        objective, solution = run_solver(problem, instance, time_limit, callback, seed, gap, stats)
+        result['objective'] = plain(objective)
+        result['solution'] = plain(solution)
+    except Timeout:
+        result['status'] = 'timeout'
+        if 'objective' in best:
+            result['objective'] = plain(best['objective'])
+            result['solution'] = plain(best['solution'])
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = repr(e)
+    finally:
+        if time_limit is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, handler)
+    if stats and stats['bound'] > 0 and result['objective'] is not None:
+        result['bound'] = plain(stats['bound'])
+        result['gap'] = (result['objective'] - result['bound']) / result['bound']
+    result['runtime'] = round(time.time() - start, 6)
+    return result
+
+def worker_main(conn, initializer, initargs):
+    # Main loop of a WorkerPool worker: run (func, args) tasks from conn and
+    # send back ('ok', result) or ('error', message)
+    # Own process group, so the worker can be killed with its children
+    # (SCIP); the parent does not reach the workers with its signals
+    try:
+        os.setpgrp()
+    except OSError:
+        pass
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        func, args = task
+        try:
+            reply = ('ok', func(*args))
+        except Exception as e:
+            reply = ('error', repr(e))
+        conn.send(reply)
+
+Task = collections.namedtuple('Task', ['func', 'args', 'callback', 'failure', 'deadline', 'time_limit'])
+
+class Worker(object):
+    # A worker process, its end of the pipe and the task it is running
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.task = None
+        self.start = None
+        self.end = None # time.time() after which the worker is killed
+
+class WorkerPool(object):
+    # Worker processes that run one task at a time, handed out by a
+    # management thread to whichever worker is idle. Unlike
+    # multiprocessing.Pool, the pool knows which task each worker runs:
+    # a task whose worker dies gets a 'crashed' result, and a worker still
+    # running grace seconds after its task's deadline is killed together
+    # with its child processes and the task gets a 'timeout' result. Lost
+    # workers are replaced. The callbacks run in the management thread.
+    def __init__(self, workers, initializer=None, initargs=(), grace=5.):
+        self.initializer = initializer
+        self.initargs = initargs
+        self.grace = grace
+        self.lock = threading.Lock()
+        self.pending = collections.deque()
+        self.wake_read, self.wake_write = os.pipe()
+        self.closed = False
+        self.workers = [self.start_worker() for i in range(workers)]
+        self.thread = threading.Thread(target=self.manage)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def start_worker(self):
+        conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=worker_main, args=(child_conn, self.initializer, self.initargs))
+        process.daemon = True
+        process.start()
+        # Also set here, so the group exists even if the worker is killed
+        # before it gets to it
+        try:
+            os.setpgid(process.pid, process.pid)
+        except OSError:
+            pass
+        child_conn.close()
+        return Worker(process, conn)
+
+    def submit(self, func, args, callback, failure, deadline=None, time_limit=None):
+        # Run func(*args) on a worker and call callback with the result, or
+        # with failure(status, error, runtime) if it raised ('error'), the
+        # worker died ('crashed') or the task ran grace seconds past its
+        # deadline ('timeout'). deadline is a time.time() value; time_limit
+        # counts from when the task starts on a worker.
+        with self.lock:
+            self.pending.append(Task(func, args, callback, failure, deadline, time_limit))
+        os.write(self.wake_write, 'x')
+
+    def queued(self):
+        return len(self.pending)
+
+    def kill(self, worker):
+        try:
+            os.killpg(worker.process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        worker.process.join()
+        worker.conn.close()
+
+    def finish(self, worker, reply):
+        task = worker.task
+        runtime = round(time.time() - worker.start, 6)
+        worker.task = worker.start = worker.end = None
+        status, value = reply
+        if status == 'ok':
+            task.callback(value)
+        else:
+            task.callback(task.failure(status, value, runtime))
+
+    def replace(self, index, status, error):
+        # Kill the worker and put a new one in its place; fail its task
+        worker = self.workers[index]
+        self.kill(worker)
+        self.workers[index] = self.start_worker()
+        if worker.task is not None:
+            self.finish(worker, (status, error))
+
+    def manage(self):
+        while not self.closed:
+            now = time.time()
+            for index, worker in enumerate(self.workers):
+                if worker.end is not None and now > worker.end:
+                    self.replace(index, 'timeout', 'Killed %g seconds after the deadline' % self.grace)
+                elif not worker.process.is_alive():
+                    self.replace(index, 'crashed', 'Worker exited with code %s' % worker.process.exitcode)
+            with self.lock:
+                for worker in self.workers:
+                    if worker.task is None and self.pending:
+                        task = self.pending.popleft()
+                        worker.task = task
+                        worker.start = time.time()
+                        if task.deadline is not None:
+                            worker.end = task.deadline + self.grace
+                        elif task.time_limit is not None:
+                            worker.end = worker.start + task.time_limit + self.grace
+                        try:
+                            worker.conn.send((task.func, task.args))
+                        except (IOError, OSError):
+                            pass # the worker died: replaced on the next round
+
+            wait = 1. # also look for dead workers every second
+            ends = [worker.end for worker in self.workers if worker.end is not None]
+            if ends:
+                wait = max(0., min(wait, min(ends) - time.time()))
+            busy = [worker.conn for worker in self.workers if worker.task is not None]
+            readable = select.select(busy + [self.wake_read], [], [], wait)[0]
+            if self.wake_read in readable:
+                os.read(self.wake_read, 4096)
+            for index, worker in enumerate(self.workers):
+                if worker.task is not None and worker.conn in readable:
+                    try:
+                        reply = worker.conn.recv()
+                    except (EOFError, IOError):
+                        self.replace(index, 'crashed', 'Worker died')
+                    else:
+                        self.finish(worker, reply)
+
+    def terminate(self):
+        # Kill the workers (and their children); tasks not finished get no
+        # callback
+        self.closed = True
+        os.write(self.wake_write, 'x')
+        self.thread.join()
+        for worker in self.workers:
+            self.kill(worker)
+        os.close(self.wake_read)
+        os.close(self.wake_write)
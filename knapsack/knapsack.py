@@ -21,34 +21,43 @@
 # 3) Keep track of the maximum value, v_max, of the successful filling.
 # Prune the node if the upper bound value of a branch is less than v_max.
 
+import os
+import sys
 from collections import namedtuple
-Item = namedtuple("Item", ['index', 'value', 'weight', 'ratio'])
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import loader
+
+# Items are kept as columns: lists of the original index, value and weight
+# of the items, sorted by the order of value/weight.
+Items = namedtuple("Items", ['index', 'value', 'weight'])
 taken = []
 
-# Calculate optimal value with linear relaxation.
-# 'items' is a list with elements sorted by the order of value/weight.
-def opt(items, capacity):
+# Calculate optimal value with linear relaxation of the items from m on.
+def opt(items, capacity, m=0):
     weight = 0
     optv = 0
-    taken_depth = [0]*len(items)
-    for item in items:
-        if weight + item.weight < capacity:
-            optv += item.value
-            weight += item.weight
+    for k in range(m, len(items.index)):
+        if weight + items.weight[k] < capacity:
+            optv += items.value[k]
+            weight += items.weight[k]
         else:
-            optv += item.value * float(capacity-weight)/item.weight
+            optv += items.value[k] * float(capacity-weight)/items.weight[k]
             break
     return optv
 
 
 # Branch and bound
 def depthfirst(items, m, maxvalue, opttaken, valuetaken, nowtaken, capacity):
+    n = len(items.index)
     # In the case that item m is selected
-    if items[m].weight <= capacity: # Here capacity means the remaining capacity
-        subcapacity = capacity - items[m].weight
-        newvaluetaken = valuetaken + items[m].value
-        nowtaken[items[m].index] = 1
-        if m < len(items)-1:
+    if items.weight[m] <= capacity: # Here capacity means the remaining capacity
+        subcapacity = capacity - items.weight[m]
+        newvaluetaken = valuetaken + items.value[m]
+        nowtaken[items.index[m]] = 1
+        if m < n-1:
             maxvalue = depthfirst(items, m+1, maxvalue, opttaken, newvaluetaken, nowtaken, subcapacity)
         else:
             if newvaluetaken > maxvalue:
@@ -56,10 +65,9 @@ def depthfirst(items, m, maxvalue, opttaken, valuetaken, nowtaken, capacity):
                 opttaken[:] = nowtaken[:]
  
     # In the case that item m is not selected
-    nowtaken[items[m].index] = 0
-    if m < len(items)-1:
-        subitems = items[m+1:len(items)] 
-        optvalue = valuetaken + opt(subitems, capacity)
+    nowtaken[items.index[m]] = 0
+    if m < n-1:
+        optvalue = valuetaken + opt(items, capacity, m+1)
         if optvalue > maxvalue:
             maxvalue = depthfirst(items, m+1, maxvalue, opttaken, valuetaken, nowtaken, capacity)
     else:
@@ -69,65 +77,275 @@ def depthfirst(items, m, maxvalue, opttaken, valuetaken, nowtaken, capacity):
     return maxvalue
  
  
-def solve_it(input_data):
+def read_knapsack(input_data):
     # Parse the input data, which contains:
     # n K
     # v_0 w_0
     # v_1 w_1
     # ...
     # v_n-1 w_n-1
+    # input_data is the text or the arrays from loader.load_instance.
+    # Return the capacity and the items sorted by ratio of value/weight.
     
-    lines = input_data.split('\n')
+    header, data = loader.instance_arrays(input_data, 2, 2)
+    item_count, capacity = header
 
-    firstLine = lines[0].split()
-    item_count = int(firstLine[0])
-    capacity = int(firstLine[1])
+    value = data[:, 0].astype(numpy.int64)
+    weight = data[:, 1].astype(numpy.int64)
+    ratio = value / weight.astype(float)
+    order = numpy.argsort(-ratio, kind='mergesort') # Sort items by ratio of value/weight
+    items = Items(order.tolist(), value[order].tolist(), weight[order].tolist())
+    return capacity, items
 
-    items = []
+# Capacity from which solve_it uses the Pareto frontier search, whose memory
+# does not grow with the capacity
+pareto_capacity = 10**6
 
-    for i in range(1, item_count+1):
-        line = lines[i]
-        parts = line.split() # v_i, w_i
-        items.append(Item(i-1, int(parts[0]), int(parts[1]), float(parts[0])/float(parts[1])))
+def incumbent_value(capacity, items, incumbent):
+    # Value of the incumbent items, or None if they are not a feasible
+    # choice of items
+    item_count = len(items.index)
+    value_of = [0]*item_count
+    weight_of = [0]*item_count
+    for k in range(item_count):
+        value_of[items.index[k]] = items.value[k]
+        weight_of[items.index[k]] = items.weight[k]
+    incumbent = set(incumbent)
+    if all(0 <= i < item_count for i in incumbent) and \
+       sum(weight_of[i] for i in incumbent) <= capacity:
+        return sum(value_of[i] for i in incumbent)
+    return None
 
-    items = sorted(items, key = lambda x: x.ratio, reverse=True) # Sort items by ratio of value/weight
-    
+def solve_it(input_data, incumbent=None, callback=None, stats=None):
+    # incumbent is an optional list of item indices, e.g. the solution of a
+    # similar instance. If it fits in the knapsack, the search starts with
+    # its value as the best so far, which prunes more of the tree.
+    # Capacities of pareto_capacity or more are solved by solve_pareto,
+    # which is given callback and stats (see there). stats, a dict, gets
+    # the name of the solver used in 'solver'.
+    # Return the maximum value and the chosen items.
+    capacity, items = read_knapsack(input_data)
+    if capacity >= pareto_capacity:
+        return solve_pareto(capacity, items, incumbent, callback, stats)
+    if stats is not None:
+        stats['solver'] = 'depthfirst'
+    item_count = len(items.index)
 
     # Use branch and bound algorithm with linear relaxation
     value = 0
-    weight = 0
-    taken = [0]*len(items)
-    temptaken = [0]*len(items)
+    taken = [0]*item_count
+    temptaken = [0]*item_count
 
     optvalue = opt(items, capacity)
 
     m = 0
     maxvalue = 0
     valuetaken = 0
+    if incumbent is not None and incumbent_value(capacity, items, incumbent) is not None:
+        maxvalue = incumbent_value(capacity, items, incumbent)
+        for i in set(incumbent):
+            taken[i] = 1
     maxvalue = depthfirst(items, m, maxvalue, taken, valuetaken, temptaken, capacity)
 
     chosen = []
-    for item in items:
-        if taken[item.index] == 1:
-            value += item.value
-            chosen.append(item.index)
+    for k in range(item_count):
+        if taken[items.index[k]] == 1:
+            value += items.value[k]
+            chosen.append(items.index[k])
     
     print "To maximize the value of the knapsack, choose items:"
     print chosen
     print "Maximum value: ", value
     
-    return
+    return value, chosen
+
+# Largest table of take-bits (items x capacities) that solve_capacities
+# builds; above it, it searches each capacity instead
+max_table_bytes = 2**28
+
+def dp_table(items, max_capacity):
+    # 0/1 knapsack DP over all capacities up to max_capacity, one numpy
+    # pass per item. Return best, where best[c] is the maximum value with
+    # capacity c, and the packed bits of whether item k was taken at each c.
+    best = numpy.zeros(max_capacity+1, dtype=numpy.int64)
+    take = []
+    for k in range(len(items.index)):
+        w = items.weight[k]
+        row = numpy.zeros(max_capacity+1, dtype=bool)
+        if w <= max_capacity:
+            cand = best[:max_capacity+1-w] + items.value[k]
+            row[w:] = cand > best[w:]
+            best[w:][row[w:]] = cand[row[w:]]
+        take.append(numpy.packbits(row))
+    return best, take
+
+def dp_chosen(items, take, capacity):
+    # Walk the take-bits back from the last item
+    taken = set()
+    c = capacity
+    for k in range(len(items.index)-1, -1, -1):
+        if (take[k][c >> 3] >> (7 - (c & 7))) & 1:
+            taken.add(items.index[k])
+            c -= items.weight[k]
+    return taken
+
+def solve_capacities(input_data, capacities):
+    # Solve the item set of input_data (its own capacity is ignored) for
+    # each capacity in the list, sharing the work between them. Small
+    # enough tables are filled by one DP pass up to the largest capacity,
+    # which answers every capacity. Otherwise the items are sorted once and
+    # the capacities searched in increasing order by branch and bound, each
+    # starting with the solution of the previous one as its incumbent (it
+    # still fits).
+    # Return a list of (value, chosen) in the order of capacities.
+    capacity, items = read_knapsack(input_data)
+    item_count = len(items.index)
+    capacities = [int(c) for c in capacities]
+    if not capacities:
+        return []
+    if min(capacities) < 0:
+        raise ValueError('Capacities must not be negative')
+    max_capacity = max(capacities)
+
+    answers = {}
+    if item_count * (max_capacity//8 + 1) <= max_table_bytes:
+        best, take = dp_table(items, max_capacity)
+        for c in set(capacities):
+            answers[c] = dp_chosen(items, take, c)
+    else:
+        taken = [0]*item_count
+        maxvalue = 0
+        for c in sorted(set(capacities)):
+            maxvalue = depthfirst(items, 0, maxvalue, taken, 0, [0]*item_count, c)
+            answers[c] = set(i for i in range(item_count) if taken[i] == 1)
+
+    results = []
+    for c in capacities:
+        value = 0
+        chosen = []
+        for k in range(item_count):
+            if items.index[k] in answers[c]:
+                value += items.value[k]
+                chosen.append(items.index[k])
+        results.append((value, chosen))
+    return results
+
+def bounds(weight, value, prefix_weight, prefix_value, capacity, m):
+    # opt() for an array of remaining capacities, for the items from m on,
+    # with the prefix sums of weight and value. Also return the value of
+    # the items from m on that fit whole, in order, which is a feasible
+    # completion.
+    base_weight = prefix_weight[m]
+    cum_weight = prefix_weight[m+1:]
+    whole = numpy.searchsorted(cum_weight, capacity + base_weight, side='right')
+    lower = prefix_value[m + whole] - prefix_value[m]
+    full = numpy.searchsorted(cum_weight, capacity + base_weight, side='left')
+    upper = (prefix_value[m + full] - prefix_value[m]).astype(float)
+    part = m + full < len(weight)
+    k = (m + full)[part]
+    upper[part] += value[k] * (capacity[part] - (prefix_weight[k] - base_weight)).astype(float) / weight[k]
+    return upper, lower
+
+def solve_pareto(capacity, items, incumbent=None, callback=None, stats=None):
+    # Nemhauser-Ullmann: after each item, keep the Pareto frontier of the
+    # (weight, value) of the subsets of the items so far, as arrays sorted
+    # by weight with strictly increasing value. The frontier of the next
+    # item is the merge of the current one and the current one with the
+    # item added; dominated states (no lighter than another of no less
+    # value) are dropped. States that cannot beat the best feasible value
+    # found, by the opt() bound of the items left, are dropped too. Memory
+    # grows with the number of states instead of the capacity, so this
+    # works for capacities in the billions.
+    # For the solution, only the weights of each frontier and a bit per
+    # state for whether it took the item are kept: a state's parent is
+    # found by its weight in the frontier before.
+    # capacity and items are as read by read_knapsack. A feasible incumbent
+    # (list of item indices) gives the first best value. callback(None,
+    # value) is called whenever the best feasible value found improves.
+    # stats, a dict, gets 'solver' and the number of frontier states made
+    # so far in 'states'.
+    # Return the maximum value and the chosen items.
+    item_count = len(items.index)
+    weight = numpy.array(items.weight, dtype=numpy.int64)
+    value = numpy.array(items.value, dtype=numpy.int64)
+    prefix_weight = numpy.concatenate(([0], numpy.cumsum(weight)))
+    prefix_value = numpy.concatenate(([0], numpy.cumsum(value)))
+
+    W = numpy.zeros(1, dtype=numpy.int64)
+    V = numpy.zeros(1, dtype=numpy.int64)
+    best = 0
+    if incumbent is not None:
+        best = incumbent_value(capacity, items, incumbent) or 0
+    if stats is not None:
+        stats['solver'] = 'pareto'
+        stats['states'] = 0
+    frontiers = []
+    for k in range(item_count):
+        fits = W + weight[k] <= capacity
+        if stats is not None:
+            stats['states'] += len(W) + int(fits.sum())
+        W = numpy.concatenate((W, W[fits] + weight[k]))
+        V = numpy.concatenate((V, V[fits] + value[k]))
+        took = numpy.concatenate((numpy.zeros(len(fits), dtype=bool), numpy.ones(fits.sum(), dtype=bool)))
+
+        # Sort by weight, then by value descending, and keep the states of
+        # more value than every lighter one
+        order = numpy.lexsort((-V, W))
+        W, V, took = W[order], V[order], took[order]
+        keep = numpy.ones(len(V), dtype=bool)
+        keep[1:] = V[1:] > numpy.maximum.accumulate(V)[:-1]
+
+        # Bound the states by the items left
+        if k < item_count-1:
+            upper, lower = bounds(weight, value, prefix_weight, prefix_value, capacity - W, k+1)
+            found = (V + lower)[keep].max()
+            if found > best:
+                best = found
+                if callback is not None:
+                    callback(None, int(best))
+            keep &= V + numpy.floor(upper + 1.e-9) >= best
+        W, V, took = W[keep], V[keep], took[keep]
+        frontiers.append((W, numpy.packbits(took)))
+
+    taken = set()
+    if item_count > 0:
+        i = int(numpy.argmax(V))
+        value_max = int(V[i])
+        w = W[i]
+        for k in range(item_count-1, -1, -1):
+            Wk, tookk = frontiers[k]
+            i = int(numpy.searchsorted(Wk, w))
+            if (tookk[i >> 3] >> (7 - (i & 7))) & 1:
+                taken.add(items.index[k])
+                w -= weight[k]
+    else:
+        value_max = 0
+
+    chosen = [items.index[k] for k in range(item_count) if items.index[k] in taken]
+    print "To maximize the value of the knapsack, choose items:"
+    print chosen
+    print "Maximum value: ", value_max
+    return value_max, chosen
 
-import sys
 sys.setrecursionlimit(100000)
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        file_location = sys.argv[1].strip()
-        input_data_file = open(file_location, 'r')
-        input_data = ''.join(input_data_file.readlines())
-        input_data_file.close()
-        solve_it(input_data)
+    args = sys.argv[1:]
+    pareto = '--pareto' in args
+    if pareto:
+        args.remove('--pareto')
+    if len(args) > 0:
+        file_location = args[0].strip()
+        input_data = loader.load_instance(file_location, 2, 2)
+        if len(args) > 1:
+            # Further arguments are capacities to solve the items for
+            capacities = [int(c) for c in args[1:]]
+            for c, (value, chosen) in zip(capacities, solve_capacities(input_data, capacities)):
+                print "Capacity", c, "maximum value:", value, "items:", chosen
+        elif pareto:
+            solve_pareto(*read_knapsack(input_data))
+        else:
+            solve_it(input_data)
     else:
-        print 'This test requires an input file. (For example: python knapsack.py ks.txt)'
+        print 'This test requires an input file. (For example: python knapsack.py [--pareto] ks.txt [capacity ...])'
 
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+
+# Instance loader shared by the solvers
+# All of the instance files are a header line of counts followed by one row
+# of numbers per item, point, facility or customer:
+#   knapsack: n K        rows: v_i w_i
+#   tsp:      n          rows: x_i y_i
+#   facility: N          rows: s_i C_i x_i y_i
+#             M          rows: D_i x_i y_i
+#   vrp:      N V c      rows: d_i x_i y_i
+# Instead of splitting lines and building one object per row, the whole
+# file is parsed in one numpy call into a float array, and the rows are
+# returned as an (n, ncols) array. Files are memory-mapped, so the text is
+# not read into a Python string first.
+
+import mmap
+
+import numpy
+
+def parse_values(values, nhead, ncols):
+    # Split the parsed numbers into the header and the rows, and check that
+    # the number of rows matches the count in the header
+    if len(values) < nhead:
+        raise ValueError('Instance header needs %d numbers, found %d' % (nhead, len(values)))
+    header = [int(h) for h in values[:nhead]]
+    count = header[0]
+    if len(values) - nhead != count * ncols:
+        raise ValueError('Instance header says %d rows of %d numbers, found %d numbers'
+                         % (count, ncols, len(values) - nhead))
+    return header, values[nhead:].reshape(count, ncols)
+
+def parse_instance(input_data, nhead, ncols):
+    # Parse instance text. Return the header counts as a list of ints and
+    # the rows as a float array of shape (n, ncols).
+    return parse_values(numpy.fromstring(input_data, sep=' '), nhead, ncols)
+
+def load_instance(file_location, nhead, ncols):
+    # Same as parse_instance, for an instance file
+    data_file = open(file_location, 'r')
+    try:
+        data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError: # mmap of an empty file
+        data_file.close()
+        raise ValueError('Instance file ' + file_location + ' is empty')
+    try:
+        values = numpy.fromstring(data, sep=' ')
+    finally:
+        data.close()
+        data_file.close()
+    return parse_values(values, nhead, ncols)
+
+def instance_arrays(input_data, nhead, ncols):
+    # Solvers accept either instance text or the (header, rows) pair from
+    # load_instance
+    if isinstance(input_data, basestring):
+        return parse_instance(input_data, nhead, ncols)
+    return input_data
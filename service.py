@@ -0,0 +1,244 @@
+#!/usr/bin/python
+
+# Solver service
+# A long-running localhost HTTP server that keeps a pool of warm worker
+# processes (interpreter started, numpy and the solvers imported) and runs
+# the existing solve_it of each problem on the instances it is sent.
+#
+# POST /solve with a JSON body:
+#   {"problem": "knapsack" | "tsp" | "vrp" | "facility",
+#    "instance": "<instance text, as in the sample files>",
+#    "customers": "<customer text, facility only>",
+#    "deadline": <seconds, optional>}
+# The reply is the JSON result of jobs.solve: status ('ok', 'timeout' or
+# 'error'), objective, solution and runtime. GET /health returns the number
+# of workers and of queued requests.
+#
+# Every request has a deadline, counted from when the service received it
+# and at most --max-time seconds. Requests go to idle workers one at a time,
+# except small knapsack instances, which solve in milliseconds: those that
+# arrive within batch_wait of each other are sent to a worker together, up
+# to batch_size of them, so the cost of handing a job to a worker is shared.
+# TSP, VRP and facility requests are never batched, as a job behind them in
+# a batch would only start once they had used up their time.
+#
+# The workers are a jobs.WorkerPool: a request whose worker dies gets a
+# 'crashed' result, and a worker still running deadline_grace seconds after
+# the deadline is killed (with SCIP, for facility) and replaced, and its
+# requests get a 'timeout' result.
+#
+# With --cache, results go through the result cache (cache.py), so repeated
+# instances are answered without solving.
+#
+# Usage: python service.py [--port 8080] [--workers N] [--max-time S] [--cache DIR]
+
+import json
+import multiprocessing
+import Queue
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import cache
+import jobs
+
+# Time a worker may run past the deadline of its requests before it is
+# killed
+deadline_grace = 5.
+
+# Default of --max-time, the longest deadline of a request
+default_max_time = 600.
+
+# Result cache of a worker process, set by worker_init
+worker_cache = []
+
+def worker_init(workroot, cache_dir=None, cache_bytes=None):
+    # Runs once in each worker process (see jobs.worker_setup)
+    jobs.worker_setup(workroot)
+    if cache_dir is not None:
+        worker_cache.append(cache.ResultCache(cache_dir, cache_bytes))
+
+def solve_batch(batch):
+    # Runs in a worker: solve the jobs one after another. Each job is
+    # (problem, instance, deadline), with deadline a time.time() value.
+    results = []
+    for problem, instance, deadline in batch:
+        time_limit = None
+        if deadline is not None:
+            time_limit = deadline - time.time()
+        if worker_cache:
+            results.append(cache.cached_solve(problem, instance, time_limit, cache=worker_cache[0]))
+        else:
+            results.append(jobs.solve(problem, instance, time_limit))
+    return results
+
+class Request(object):
+    # A job waiting for its result
+    def __init__(self, problem, instance, deadline):
+        self.problem = problem
+        self.instance = instance
+        self.deadline = deadline
+        if problem == 'facility':
+            self.size = len(instance[0]) + len(instance[1])
+        else:
+            self.size = len(instance)
+        self.done = threading.Event()
+        self.result = None
+
+    def job(self):
+        return (self.problem, self.instance, self.deadline)
+
+    def failed(self, status, error, runtime):
+        return {'problem': self.problem, 'status': status, 'objective': None, 'solution': None,
+                'runtime': runtime, 'error': error}
+
+class Dispatcher(threading.Thread):
+    # Takes requests off the queue and hands them to the pool, grouping
+    # small knapsack ones into batches
+    def __init__(self, pool, batch_size, batch_wait, small_bytes):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.pool = pool
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.small_bytes = small_bytes
+        self.queue = Queue.Queue()
+
+    def submit(self, request):
+        self.queue.put(request)
+
+    def batched(self, request):
+        return request.problem == 'knapsack' and request.size <= self.small_bytes
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            if self.batched(batch[0]):
+                end = time.time() + self.batch_wait
+                while len(batch) < self.batch_size:
+                    try:
+                        request = self.queue.get(timeout=max(end - time.time(), 0.))
+                    except Queue.Empty:
+                        break
+                    if self.batched(request):
+                        batch.append(request)
+                    else:
+                        self.send([request])
+            self.send(batch)
+
+    def send(self, batch):
+        def deliver(results):
+            for request, result in zip(batch, results):
+                request.result = result
+                request.done.set()
+
+        def failure(status, error, runtime):
+            return [request.failed(status, error, runtime) for request in batch]
+
+        deadline = max(request.deadline for request in batch)
+        self.pool.submit(solve_batch, ([request.job() for request in batch],), deliver, failure, deadline=deadline)
+
+class Handler(BaseHTTPRequestHandler):
+    def reply(self, code, data):
+        body = json.dumps(data)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.reply(200, {'workers': self.server.workers,
+                             'queued': self.server.dispatcher.queue.qsize() + self.server.pool.queued()})
+        else:
+            self.reply(404, {'status': 'error', 'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path != '/solve':
+            self.reply(404, {'status': 'error', 'error': 'Not found'})
+            return
+        try:
+            data = json.loads(self.rfile.read(int(self.headers.getheader('Content-Length', 0))))
+            problem = str(data['problem'])
+            if problem not in jobs.problems:
+                raise ValueError('Unknown problem ' + repr(problem))
+            instance = str(data['instance'])
+            if problem == 'facility':
+                instance = (instance, str(data['customers']))
+            deadline = data.get('deadline')
+            if deadline is None:
+                deadline = self.server.max_time
+            deadline = time.time() + min(float(deadline), self.server.max_time)
+        except Exception as e:
+            self.reply(400, {'status': 'error', 'error': repr(e)})
+            return
+
+        request = Request(problem, instance, deadline)
+        self.server.dispatcher.submit(request)
+        # The pool answers by the deadline plus the grace time; this wait is
+        # only a backstop
+        if not request.done.wait(deadline - time.time() + 2 * deadline_grace):
+            self.reply(504, {'problem': problem, 'status': 'timeout', 'objective': None, 'solution': None,
+                             'error': 'No result from the workers'})
+            return
+        self.reply(200, request.result)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve the solvers over HTTP on localhost.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='port (default: 8080)')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='worker processes (default: number of cores)')
+    parser.add_argument('--batch-size', type=int, default=16, help='most requests per batch (default: 16)')
+    parser.add_argument('--batch-wait', type=float, default=0.005,
+                        help='seconds to wait for more small requests (default: 0.005)')
+    parser.add_argument('--small-bytes', type=int, default=20000,
+                        help='largest instance text that is batched (default: 20000)')
+    parser.add_argument('--max-time', type=float, default=default_max_time,
+                        help='longest deadline of a request, in seconds (default: %g)' % default_max_time)
+    parser.add_argument('--cache', default=None, metavar='DIR', help='keep results in a result cache in DIR')
+    parser.add_argument('--cache-bytes', type=int, default=cache.default_max_bytes,
+                        help='size limit of the result cache (default: %d)' % cache.default_max_bytes)
+    parser.add_argument('--quiet', action='store_true', help='do not log requests')
+    args = parser.parse_args()
+
+    workroot = tempfile.mkdtemp(prefix='service')
+    pool = jobs.WorkerPool(args.workers, worker_init, (workroot, args.cache, args.cache_bytes), deadline_grace)
+    dispatcher = Dispatcher(pool, args.batch_size, args.batch_wait, args.small_bytes)
+    dispatcher.start()
+
+    # Shut down cleanly on SIGTERM too (the workers reset it to the default)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    server = Server((args.host, args.port), Handler)
+    server.workers = args.workers
+    server.dispatcher = dispatcher
+    server.pool = pool
+    server.max_time = args.max_time
+    server.quiet = args.quiet
+    print 'Serving on', args.host, 'port', args.port, 'with', args.workers, 'workers'
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.terminate()
+        shutil.rmtree(workroot, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
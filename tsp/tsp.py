@@ -6,16 +6,22 @@
 # My solution is using simulated annealing to find the minimum
 
 import math
-from collections import namedtuple
+import os
+import sys
+import time
+
+import numpy
 
-Point = namedtuple("Point", ['x', 'y'])
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import loader
 
-def length(point1, point2):
-    return math.sqrt((point1.x - point2.x)**2 + (point1.y - point2.y)**2)
+# Nodes are kept as two coordinate lists x and y, indexed by node
+def length(x, y, i, j):
+    return math.sqrt((x[i] - x[j])**2 + (y[i] - y[j])**2)
 
 import random
 
-def rand_init(alist, points):
+def rand_init(alist, x, y):
     # Randomly start from a point and connect to nearest neighbor if possible
     blist = list(alist)
     clist = []
@@ -27,7 +33,7 @@ def rand_init(alist, points):
         qmin = blist[0]
         # Find nearest neighbor to p
         for q in blist:  
-            dis = length(points[p],points[q])
+            dis = length(x, y, p, q)
             if dmin > dis:
                 dmin = dis
                 qmin = q
@@ -37,7 +43,7 @@ def rand_init(alist, points):
         #print "length of blist = ", len(blist)
     return clist      
 
-def rand_swap(alist, points, obj, t):
+def rand_swap(alist, x, y, obj, t):
     n = len(alist) # number of elements in the list
     u = random.randrange(0, n)
     v = u
@@ -54,11 +60,11 @@ def rand_swap(alist, points, obj, t):
         a = [ alist[u-1], alist[0] ]
     
     if (u == 0) & (v == (n - 1)):
-        uv_len[0] += length(points[alist[u]], points[alist[u+1]]) + length(points[alist[v]], points[alist[v-1]])
-        uv_len[1] += length(points[alist[v]], points[alist[u+1]]) + length(points[alist[u]], points[alist[v-1]])
+        uv_len[0] += length(x, y, alist[u], alist[u+1]) + length(x, y, alist[v], alist[v-1])
+        uv_len[1] += length(x, y, alist[v], alist[u+1]) + length(x, y, alist[u], alist[v-1])
     else:
-        uv_len[0] += length(points[a[0]], points[alist[u]]) + length(points[alist[v]], points[a[1]])
-        uv_len[1] += length(points[a[0]], points[alist[v]]) + length(points[alist[u]], points[a[1]])
+        uv_len[0] += length(x, y, a[0], alist[u]) + length(x, y, alist[v], a[1])
+        uv_len[1] += length(x, y, a[0], alist[v]) + length(x, y, alist[u], a[1])
     diff_len = uv_len[1] - uv_len[0]
 
     k = obj/n/5. # scaled average distance between adjacent nodes
@@ -84,7 +90,432 @@ def rand_swap(alist, points, obj, t):
 
     return obj     
 
-def solve_it(input_data):
+# Lower bound
+# The Held-Karp bound: a 1-tree is a spanning tree of nodes 1..n-1 plus two
+# edges at node 0, and every tour is one, so the shortest 1-tree is a lower
+# bound on the tour. Adding a penalty pi_i to every edge at node i adds
+# 2 sum(pi) to every tour but not to every 1-tree, so
+#   shortest 1-tree with penalties - 2 sum(pi)
+# is a bound for any pi. Subgradient steps raise the penalty of nodes with
+# more than two tree edges and lower it for leaves, pushing the 1-tree
+# towards a tour and the bound up, usually to within a few percent of the
+# optimum.
+#
+# The tree is built on the graph of each node's k nearest neighbours (found
+# with numpy, see knn_graph). An edge i-j outside the graph is at least
+# as long as the k-th neighbour distance of both i and j, so
+#   a_i + a_j, with a_i = kth_i/2 + pi_i,
+# is a lower bound on its cost. Kruskal's algorithm over the graph edges
+# also takes these edges, between the two components with the smallest a,
+# whenever they are cheaper than the next graph edge. The tree is then a
+# shortest 1-tree for costs no higher than the real ones, so the bound
+# holds even if the real shortest 1-tree uses edges outside the graph.
+
+import heapq
+
+bound_time = 60. # most seconds solve_it (or solve_large) spends on the bound
+
+# Most distances computed at once (about 64 MB) when looking for neighbours
+knn_block = 2**23
+
+def grid_neighbours(x, y, rows, k, side):
+    # k nearest nodes of each node in rows, from the nodes in the 5x5 cells
+    # around its cell in a grid of cells of the given side. Return the rows
+    # (reordered by cell, so the rows of a block have cells of about the
+    # same size), a mask of those for which they are certainly the nearest
+    # (the k-th is within 2 sides, and every node outside the 25 cells is
+    # farther), their indices and the k-th distance.
+    gx = numpy.floor((x - x.min()) / side).astype(numpy.int64) + 2
+    gy = numpy.floor((y - y.min()) / side).astype(numpy.int64) + 2
+    height = int(gy.max()) + 3
+    key = gx * height + gy
+    order = numpy.argsort(key, kind='mergesort')
+    sorted_key = key[order]
+    rows = rows[numpy.argsort(key[rows], kind='mergesort')]
+    ok = numpy.zeros(len(rows), dtype=bool)
+    nbr = numpy.zeros((len(rows), k), dtype=numpy.int64)
+    kth = numpy.zeros(len(rows))
+    offsets = numpy.array([dx * height + dy for dx in range(-2, 3) for dy in range(-2, 3)])
+    for a in range(0, len(rows), 1024):
+        block = rows[a:a+1024]
+        cell = key[block][:, None] + offsets[None, :]
+        first = numpy.searchsorted(sorted_key, cell, 'left')
+        last = numpy.searchsorted(sorted_key, cell, 'right')
+        cap = max(1, int((last - first).max())) # most nodes in a cell
+        chunk = max(1, knn_block // (25 * cap))
+        for b in range(0, len(block), chunk):
+            r = block[b:b+chunk]
+            pos = first[b:b+chunk, :, None] + numpy.arange(cap)[None, None, :]
+            valid = pos < last[b:b+chunk, :, None]
+            cand = order[numpy.minimum(pos, len(order) - 1)].reshape(len(r), -1)
+            valid = valid.reshape(len(r), -1) & (cand != r[:, None])
+            d = numpy.hypot(x[cand] - x[r, None], y[cand] - y[r, None])
+            d[~valid] = numpy.inf
+            idx = numpy.argpartition(d, k-1, axis=1)[:, :k]
+            rr = numpy.arange(len(r))[:, None]
+            far = d[rr, idx].max(axis=1)
+            ok[a+b:a+b+len(r)] = far <= 2. * side
+            nbr[a+b:a+b+len(r)] = cand[rr, idx]
+            kth[a+b:a+b+len(r)] = far
+    return rows, ok, nbr, kth
+
+def knn_graph(x, y, k=10):
+    # Edges (u, v) with u < v between each node and its k nearest nodes,
+    # their lengths, and the distance of each node's k-th nearest node.
+    # The neighbours are looked up in grids of cells (a few nodes per cell
+    # on average, then coarser and finer for the nodes in sparse or dense
+    # parts), so time and memory grow about linearly with the nodes; the
+    # few nodes left are done by brute force, in blocks of rows that get
+    # smaller as the nodes get more.
+    n = len(x)
+    k = min(k, n-1)
+    nbr = numpy.empty((n, k), dtype=numpy.int64)
+    kth = numpy.empty(n)
+    todo = numpy.arange(n)
+    span = max(x.max() - x.min(), y.max() - y.min(), 1.e-12)
+    side = span * math.sqrt(k / (5. * n)) # k/5 nodes per cell, about 2.5 k in reach
+    for scale in [1., 0.5, 2., 0.25, 4., 0.125, 8.]:
+        if len(todo) == 0:
+            break
+        todo, ok, nbr_todo, kth_todo = grid_neighbours(x, y, todo, k, side * scale)
+        nbr[todo[ok]] = nbr_todo[ok]
+        kth[todo[ok]] = kth_todo[ok]
+        todo = todo[~ok]
+    chunk = max(1, knn_block // n)
+    for a in range(0, len(todo), chunk):
+        r = todo[a:a+chunk]
+        d = numpy.hypot(x[r, None] - x[None, :], y[r, None] - y[None, :])
+        rows = numpy.arange(len(r))
+        d[rows, r] = numpy.inf
+        idx = numpy.argpartition(d, k-1, axis=1)[:, :k]
+        nbr[r] = idx
+        kth[r] = d[rows[:, None], idx].max(axis=1)
+    u = numpy.repeat(numpy.arange(n), k)
+    v = nbr.ravel()
+    key = numpy.unique(numpy.minimum(u, v) * n + numpy.maximum(u, v))
+    u = key // n
+    v = key % n
+    return u, v, numpy.hypot(x[u] - x[v], y[u] - y[v]), kth
+
+def one_tree(x, y, u, v, c, kth, pi):
+    # Shortest 1-tree with penalties pi (see above). Return its cost less
+    # 2 sum(pi), which is the bound, and the degree of each node.
+    n = len(x)
+    deg = numpy.zeros(n, dtype=numpy.int64)
+
+    # Two shortest edges at node 0
+    d0 = numpy.hypot(x - x[0], y - y[0]) + pi + pi[0]
+    d0[0] = numpy.inf
+    ends = numpy.argpartition(d0, 1)[:2]
+    total = float(d0[ends].sum())
+    deg[0] = 2
+    deg[ends] += 1
+
+    # Kruskal on nodes 1..n-1
+    rest = u != 0 # u < v, so these edges do not touch node 0
+    cost = c[rest] + pi[u[rest]] + pi[v[rest]]
+    order = numpy.argsort(cost, kind='mergesort')
+    eu = u[rest][order].tolist()
+    ev = v[rest][order].tolist()
+    ec = cost[order].tolist()
+    a = (kth / 2. + pi).tolist()
+    parent = range(n)
+    cmin = list(a) # smallest a of the component of each root, and its node
+    cnode = range(n)
+    heap = [(a[i], i) for i in range(1, n)]
+    heapq.heapify(heap)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def smallest():
+        # Root with the smallest cmin, dropping stale heap entries
+        while True:
+            value, r = heap[0]
+            if parent[r] == r and cmin[r] == value:
+                return heapq.heappop(heap)
+            heapq.heappop(heap)
+
+    edges = 0
+    e = 0
+    while edges < n-2:
+        first = smallest()
+        second = smallest()
+        heapq.heappush(heap, first)
+        heapq.heappush(heap, second)
+        while e < len(ec):
+            ru = find(eu[e])
+            rv = find(ev[e])
+            if ru != rv: break
+            e += 1
+        if e < len(ec) and ec[e] <= first[0] + second[0]:
+            i, j, cost_ij = eu[e], ev[e], ec[e]
+            e += 1
+        else:
+            ru, rv = first[1], second[1]
+            i, j, cost_ij = cnode[ru], cnode[rv], first[0] + second[0]
+        total += cost_ij
+        deg[i] += 1
+        deg[j] += 1
+        parent[rv] = ru
+        if cmin[rv] < cmin[ru]:
+            cmin[ru] = cmin[rv]
+            cnode[ru] = cnode[rv]
+        heapq.heappush(heap, (cmin[ru], ru))
+        edges += 1
+
+    return total - 2. * float(pi.sum()), deg
+
+def held_karp_bound(x, y, upper, k=10, iterations=300, time_limit=None):
+    # Lower bound on the tour of points x, y (numpy arrays), by subgradient
+    # steps on the 1-tree penalties. upper is the length of a known tour,
+    # which sets the step size. With time_limit, stop when the time is up.
+    start = time.time()
+    n = len(x)
+    if n < 3:
+        return upper
+    u, v, c, kth = knn_graph(x, y, k)
+    pi = numpy.zeros(n)
+    pi_best = pi
+    bound = 0.
+    alpha = 2.
+    stall = 0
+    for it in range(iterations):
+        value, deg = one_tree(x, y, u, v, c, kth, pi)
+        if value > bound:
+            bound = value
+            pi_best = pi.copy()
+            stall = 0
+        else:
+            stall += 1
+            if stall == 5:
+                # Steps too long (upper is only an estimate of the optimum):
+                # halve them and go back to the best penalties
+                alpha /= 2.
+                stall = 0
+                pi = pi_best.copy()
+                value, deg = one_tree(x, y, u, v, c, kth, pi)
+        g = deg - 2
+        norm = float((g * g).sum())
+        if norm == 0 or bound >= upper * (1 - 1.e-9):
+            break # the 1-tree is a tour, or the tour is optimal
+        if time_limit is not None and time.time() - start > time_limit:
+            break
+        pi += alpha * (upper - value) / norm * g
+    return min(bound, upper)
+
+# Large instances
+# rand_init is quadratic and one annealing chain over the whole tour is too
+# slow for hundreds of thousands of nodes. Instead, the nodes are ordered
+# along a Hilbert curve (nearby on the curve means nearby in the plane),
+# which gives a tour about 25% longer than optimal in O(n log n). The tour
+# is then cut into segments of consecutive nodes, and each segment is
+# annealed on its own by a process pool as a path with its two ends fixed,
+# so the tour stays one cycle. Each round shifts the cuts by half a
+# segment, so the edges near the old cuts get optimized in the next round.
+
+large_node_count = 20000 # solve_it uses solve_large from this many nodes
+
+def hilbert_order(x, y, bits=16):
+    # Order of the points along a Hilbert curve over a 2^bits grid
+    span = max(x.max() - x.min(), y.max() - y.min(), 1.e-12)
+    side = 1 << bits
+    hx = ((x - x.min()) / span * (side - 1)).astype(numpy.int64)
+    hy = ((y - y.min()) / span * (side - 1)).astype(numpy.int64)
+    d = numpy.zeros(len(x), dtype=numpy.int64)
+    s = side >> 1
+    while s > 0:
+        rx = (hx & s) > 0
+        ry = (hy & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant so the curve inside it has the base shape
+        flip = ~ry & rx
+        hx[flip] = side - 1 - hx[flip]
+        hy[flip] = side - 1 - hy[flip]
+        turn = ~ry
+        hx[turn], hy[turn] = hy[turn], hx[turn]
+        s >>= 1
+    return numpy.argsort(d, kind='mergesort')
+
+def tour_length(x, y, tour):
+    # Length of the closed tour, with x and y numpy arrays
+    tx = x[tour]
+    ty = y[tour]
+    return float(numpy.hypot(tx - numpy.roll(tx, -1), ty - numpy.roll(ty, -1)).sum())
+
+def path_swap(alist, x, y, obj, t):
+    # rand_swap for a path with fixed ends: reverse alist[u:v+1] with
+    # 0 < u < v < n-1, so alist[0] and alist[-1] never move
+    n = len(alist)
+    u = random.randrange(1, n-1)
+    v = u
+    while (v == u):
+        v = random.randrange(1, n-1)
+    [ u, v ] = sorted([u,v])
+
+    diff_len = length(x, y, alist[u-1], alist[v]) + length(x, y, alist[u], alist[v+1]) \
+             - length(x, y, alist[u-1], alist[u]) - length(x, y, alist[v], alist[v+1])
+
+    k = obj/n/5. # scaled average distance between adjacent nodes
+
+    bkt = -diff_len/(k*t)
+    if (bkt > 708.):
+        p = 1.
+    else:
+        pf = math.exp(bkt)
+        p = pf/(pf+1.)
+
+    if (random.random() <= p):
+        alist[u:v+1] = alist[v:u-1:-1]
+        obj += diff_len
+
+    return obj
+
+def segment_run(args):
+    # Anneal one segment (runs in a pool worker). x and y are the
+    # coordinates of the segment's nodes in tour order. Return the best
+    # order found, as positions in the segment; the first and last stay.
+    x, y, nswap, temperatures, deadline, seed = args
+    random.seed(seed)
+    n = len(x)
+    alist = range(n)
+    obj = sum(length(x, y, i, i+1) for i in range(n-1))
+    obj_min = obj
+    solution_min = list(alist)
+    if n < 4:
+        return solution_min
+    for t in temperatures:
+        for i in range(nswap):
+            obj = path_swap(alist, x, y, obj, t)
+            if (i % 1000 == 0) and deadline is not None and time.time() > deadline:
+                break
+        if obj_min > obj:
+            obj_min = obj
+            solution_min = list(alist)
+        if deadline is not None and time.time() > deadline:
+            break
+    return solution_min
+
+def solve_large(input_data, workers=None, segment_size=200, rounds=6, swaps_per_node=300,
+                temperatures=(0.3, 0.2, 0.1, 0.05, 0.02, 0.01), time_limit=None, callback=None,
+                init_tour=None, gap=None, stats=None):
+    # Hilbert curve tour improved by rounds of parallel segment annealing.
+    # Each segment gets about swaps_per_node swaps per node per round,
+    # spread over the temperatures. With time_limit, rounds stop when the
+    # time is up (segments check it too). callback(tour, obj) is called
+    # after each round that shortened the tour. The segments run on a pool
+    # of workers processes, or in this process with one worker or in a
+    # daemonic process (such as a jobs.WorkerPool worker), which cannot
+    # have children.
+    # gap and stats are as for solve_it: the bound is computed from the
+    # Hilbert curve tour, in at most bound_time seconds (and a quarter of
+    # time_limit) after its first step, and the rounds stop once the tour
+    # is within gap of it.
+    # Return the length and the tour.
+    import multiprocessing
+    start = time.time()
+    header, data = loader.instance_arrays(input_data, 1, 2)
+    nodeCount = header[0]
+    x = numpy.ascontiguousarray(data[:, 0])
+    y = numpy.ascontiguousarray(data[:, 1])
+    print "Solving traveling salesman problem on segments..."
+    print "Number of nodes: ", nodeCount, "\n"
+
+    if init_tour is not None and sorted(init_tour) == range(nodeCount):
+        tour = numpy.array(init_tour, dtype=numpy.int64)
+    else:
+        tour = hilbert_order(x, y)
+    obj = tour_length(x, y, tour)
+    print "Hilbert curve tour:", obj
+    if callback is not None:
+        callback(tour.tolist(), obj)
+
+    bound = None
+    target = -1. # stop once obj is at most this
+    if gap is not None or stats is not None:
+        bound_limit = bound_time
+        if time_limit is not None:
+            bound_limit = min(bound_time, 0.25 * time_limit)
+        bound = held_karp_bound(x, y, obj, time_limit=bound_limit)
+        print "Lower bound:", bound
+        if stats is not None:
+            stats['bound'] = bound
+        if gap is not None:
+            target = bound * (1. + gap)
+
+    deadline = None
+    if time_limit is not None:
+        deadline = start + time_limit
+    segment_size = max(segment_size, 4)
+    nswap = max(1, swaps_per_node * segment_size // len(temperatures))
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    pool = None
+    if workers > 1 and not multiprocessing.current_process().daemon:
+        pool = multiprocessing.Pool(workers)
+    try:
+        for r in range(rounds):
+            if deadline is not None and time.time() > deadline:
+                break
+            if obj <= target:
+                print "Within the gap of the lower bound"
+                break
+            # Rotate the tour so the cuts move by half a segment each round
+            tour = numpy.roll(tour, -(segment_size // 2))
+            cuts = range(0, nodeCount, segment_size) + [nodeCount]
+            tasks = []
+            for a, b in zip(cuts[:-1], cuts[1:]):
+                segment = tour[a:b]
+                tasks.append((x[segment].tolist(), y[segment].tolist(), nswap, temperatures, deadline,
+                              random.randrange(1 << 30)))
+            if pool is None:
+                orders = map(segment_run, tasks)
+            else:
+                pending = pool.map_async(segment_run, tasks, max(1, len(tasks) // (4 * workers)))
+                while True:
+                    # Wait with a timeout, so a SIGALRM time limit (jobs.py)
+                    # is handled while the segments run
+                    try:
+                        orders = pending.get(1.)
+                        break
+                    except multiprocessing.TimeoutError:
+                        pass
+            for a, order in zip(cuts[:-1], orders):
+                tour[a:a+len(order)] = tour[a:a+len(order)][order]
+            obj_round = tour_length(x, y, tour)
+            print "Round", r, " tour length:", obj_round, " time:", round(time.time() - start, 2)
+            if obj_round < obj and callback is not None:
+                callback(tour.tolist(), obj_round)
+            obj = obj_round
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    if bound:
+        print "Gap to lower bound: ", (obj - bound) / bound
+        if stats is not None:
+            stats['gap'] = (obj - bound) / bound
+    return obj, tour.tolist()
+
+def solve_it(input_data, callback=None, init_tour=None, gap=None, stats=None, time_limit=None):
+    # callback(solution_min, obj_min) is called whenever the shortest tour
+    # improves (checked every 1000 swaps).
+    # init_tour is an optional starting tour for the first annealing cycle,
+    # e.g. the tour of a similar instance; it is used if it visits every
+    # node once.
+    # With gap (e.g. 0.02), the Held-Karp lower bound is computed from the
+    # first tour and annealing stops once the tour is within gap of it.
+    # stats is an optional dict; it gets the bound and the final gap
+    # (computing the bound if gap is not given).
+    # time_limit (seconds) limits the time of the bound to a quarter of it,
+    # and is passed on to solve_large for large instances; the annealing
+    # itself is stopped by the caller (see jobs.py).
+    # Return the shortest distance and tour.
+    #
     # Parse the input data:
     # n
     # x_0, y_0
@@ -92,35 +523,53 @@ def solve_it(input_data):
     # ...
     # x_n-1, y_n-1
     
-    lines = input_data.split('\n')
-
-    nodeCount = int(lines[0])
+    # input_data is the text or the arrays from loader.load_instance
+    
+    header, data = loader.instance_arrays(input_data, 1, 2)
+    nodeCount = header[0]
+    if nodeCount >= large_node_count:
+        return solve_large((header, data), callback=callback, init_tour=init_tour, gap=gap, stats=stats,
+                           time_limit=time_limit)
 
     print "Solving traveling salesman problem..."
     print "Number of nodes: ", nodeCount, "\n"
     
-    points = []
-    for i in range(1, nodeCount+1):
-        line = lines[i]
-        parts = line.split()
-        points.append(Point(float(parts[0]), float(parts[1])))
+    x = data[:, 0].tolist()
+    y = data[:, 1].tolist()
 
 
     obj_min = 1.e20
     solution_min = range(0,nodeCount)
+    bound = None
+    target = -1. # stop once obj_min is at most this
+    done = False
     
     # Start Annealing cycle
     for j in range(2):
         print "Annealing", j+1, ":"
         solution = range(0, nodeCount)
         
-        # Starting from a random point and connect to its nearest neighbor
-        solution = rand_init(solution, points)
+        if j == 0 and init_tour is not None and sorted(init_tour) == solution:
+            solution = list(init_tour)
+        else:
+            # Starting from a random point and connect to its nearest neighbor
+            solution = rand_init(solution, x, y)
 
         # Calculate the length of the tour
-        obj = length(points[solution[-1]], points[solution[0]])
+        obj = length(x, y, solution[-1], solution[0])
         for index in range(0, nodeCount-1):
-            obj += length(points[solution[index]], points[solution[index+1]])
+            obj += length(x, y, solution[index], solution[index+1])
+
+        if bound is None and (gap is not None or stats is not None):
+            bound_limit = bound_time
+            if time_limit is not None:
+                bound_limit = min(bound_time, 0.25 * time_limit)
+            bound = held_karp_bound(data[:, 0], data[:, 1], obj, time_limit=bound_limit)
+            print "Lower bound:", bound
+            if stats is not None:
+                stats['bound'] = bound
+            if gap is not None:
+                target = bound * (1. + gap)
 
         # Use random swap algorithm    
         nswap = 2000000 # increase nswap for larger node count
@@ -129,8 +578,9 @@ def solve_it(input_data):
             converge = True
             temp = obj
             print "T scale:", t, " minimum so far: ", obj_min
+            improved = False
             for i in range(nswap):
-                obj = rand_swap(solution, points, obj, t)
+                obj = rand_swap(solution, x, y, obj, t)
 
                 if (i % 200000 == 0):
                     print "Iteration", i, ", obj value:", obj
@@ -142,25 +592,42 @@ def solve_it(input_data):
                 if obj_min > obj:
                     obj_min = obj
                     solution_min = list(solution)
+                    improved = True
+
+                if (i % 1000 == 0) and improved and callback is not None:
+                    callback(solution_min, obj_min)
+                    improved = False
+
+                if obj_min <= target:
+                    done = True
+                    break
                     
+            if improved and callback is not None:
+                callback(solution_min, obj_min)
             print
             
-            if converge: break
+            if converge or done: break
+        if done:
+            print "Within the gap of the lower bound"
+            break
 
     print "Shortest route: ", ' '.join(map(str, solution_min))
     print "Total distance: ", obj_min
+    if bound:
+        print "Gap to lower bound: ", (obj_min - bound) / bound
+        if stats is not None:
+            stats['gap'] = (obj_min - bound) / bound
     
-    return
-
-import sys
+    return obj_min, solution_min
 
 if __name__ == '__main__':
     if len(sys.argv) > 1:
         file_location = sys.argv[1].strip()
-        input_data_file = open(file_location, 'r')
-        input_data = ''.join(input_data_file.readlines())
-        input_data_file.close()
-        solve_it(input_data)
+        input_data = loader.load_instance(file_location, 1, 2)
+        gap = None
+        if len(sys.argv) > 2:
+            gap = float(sys.argv[2])
+        solve_it(input_data, gap=gap)
     else:
-        print 'This test requires an input file (For example: python solver.py tsp_50.txt).'
+        print 'This test requires an input file (For example: python solver.py tsp_50.txt [gap]).'
 
@@ -31,17 +31,78 @@
 # Here I use the simulated annealing algorithm to find the optimal routes.
 
 import math
-from collections import namedtuple
+import os
+import sys
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import loader
+
+# Largest distance matrix (in bytes) that is precomputed; larger instances
+# compute distances on the fly from the coordinate arrays.
+max_matrix_bytes = 256 * 2**20
+
+class PointDistance(object):
+    # Same indexing as the distance matrix, dist[i, j], but computes the
+    # distance from the coordinates each time. Used when n*n floats would
+    # not fit in max_matrix_bytes.
+    def __init__(self, x, y):
+        self.xa = numpy.asarray(x)
+        self.ya = numpy.asarray(y)
+        self.x = list(x)
+        self.y = list(y)
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, ij):
+        i, j = ij
+        return math.sqrt((self.x[i] - self.x[j])**2 + (self.y[i] - self.y[j])**2)
 
-Customer = namedtuple("Customer", ['index', 'demand', 'x', 'y'])
-Point = namedtuple("Point", ['x', 'y'])
+    def row(self, i):
+        return numpy.hypot(self.xa - self.x[i], self.ya - self.y[i])
 
-def length(customer1, customer2):
-    return math.sqrt((customer1.x - customer2.x)**2 + (customer1.y - customer2.y)**2)
+    def pairs(self, i, j):
+        return numpy.hypot(self.xa[i] - self.xa[j], self.ya[i] - self.ya[j])
+
+def dist_row(dist, i):
+    # Distances from location i to all locations, as a numpy array
+    if isinstance(dist, PointDistance):
+        return dist.row(i)
+    return dist[i]
+
+def dist_pairs(dist, i, j):
+    # Distances between locations i[k] and j[k], for index arrays i and j
+    if isinstance(dist, PointDistance):
+        return dist.pairs(i, j)
+    return dist[i, j]
+
+def dist_matrix(x, y, max_bytes=None):
+    # x, y are numpy arrays of coordinates. Return dist, where dist[i, j] is
+    # the distance between location i and j.
+    if max_bytes is None:
+        max_bytes = max_matrix_bytes
+    n = len(x)
+    if n * n * 8 > max_bytes:
+        return PointDistance(x, y)
+    return numpy.hypot(x[:, None] - x[None, :], y[:, None] - y[None, :])
+
+def tour_length(vehicle_t, dist):
+    # Total travel distance of all vehicles, each starting and ending at 0
+    obj = 0
+    for tour in vehicle_t:
+        if len(tour) > 0:
+            obj += dist[0, tour[0]]
+            for i in range(0, len(tour)-1):
+                obj += dist[tour[i], tour[i+1]]
+            obj += dist[tour[-1], 0]
+    return obj
 
 import random
-def ori_init(alist, points):
-    # Start from origin and connect to nearest neighbor if possible
+def ori_init(alist, dist, deadline=None):
+    # Start from origin and connect to nearest neighbor if possible.
+    # Return None if the deadline (a time.time() value) passes first.
     blist = list(alist)
     clist = []
     p = random.randrange(0, len(blist)) # starting point
@@ -53,16 +114,18 @@ def ori_init(alist, points):
         qmin = blist[0]
         # Find the nearest neighbor to p
         for q in blist:  
-            dis = length(points[p],points[q])
+            dis = dist[p, q]
             if dmin > dis:
                 dmin = dis
                 qmin = q
         p = qmin
         clist.append(p)
         blist.remove(p)
+        if deadline is not None and time.time() > deadline:
+            return None
     return clist
 
-def kopt2(vehicle_t, points, obj_kopt):
+def kopt2(vehicle_t, dist, obj_kopt):
     for i_tour in range(0,len(vehicle_t)):
         swaplist = list(vehicle_t[i_tour])
         swaplist = [0] + swaplist + [0]
@@ -74,8 +137,8 @@ def kopt2(vehicle_t, points, obj_kopt):
                 diff_min = 1e20
                 j_min = 0
                 for j in range(i+1, len(vehicle_t[i_tour])+1):
-                    cost1 = length(points[swaplist[i-1]], points[swaplist[i]]) + length(points[swaplist[j]], points[swaplist[j+1]])
-                    cost2 = length(points[swaplist[i-1]], points[swaplist[j]]) + length(points[swaplist[i]], points[swaplist[j+1]])
+                    cost1 = dist[swaplist[i-1], swaplist[i]] + dist[swaplist[j], swaplist[j+1]]
+                    cost2 = dist[swaplist[i-1], swaplist[j]] + dist[swaplist[i], swaplist[j+1]]
                     diff_cost = cost2 - cost1
                     if diff_cost < 0: # find the best swap for all j
                         j_diff.append([j, diff_cost])
@@ -90,22 +153,14 @@ def kopt2(vehicle_t, points, obj_kopt):
         vehicle_t[i_tour] = swaplist[1:-1]
 
     
-    obj_test = 0
-    for v in range(0, len(vehicle_t)):
-        vehicle_tour = vehicle_t[v]
-
-        if len(vehicle_tour) > 0:
-            obj_test += length(points[0],points[vehicle_tour[0]])
-            for i in range(0, len(vehicle_tour)-1):
-                obj_test += length(points[vehicle_tour[i]],points[vehicle_tour[i+1]])
-            obj_test += length(points[vehicle_tour[-1]],points[0])
+    obj_test = tour_length(vehicle_t, dist)
     
     if abs(obj_kopt - obj_test) > 1.e-6:
         print "obj_kopt not equal to obj_test!!!"
         print
     return obj_kopt
 
-def rand_interswap(vehicle_t, points, vc, obj, t):
+def rand_interswap(vehicle_t, dist, vc, obj, t):
     # Swap two customers allocated to different vehicles
     v1 = vc[0][0]
     v2 = vc[1][0]
@@ -116,13 +171,13 @@ def rand_interswap(vehicle_t, points, vc, obj, t):
     c1 = vc[0][1]  # c1 = 1 is the first customer on the vehicle 
     c2 = vc[1][1]
 
-    cost1 = length(points[swaplist1[c1-1]], points[swaplist1[c1]]) + length(points[swaplist1[c1]], points[swaplist1[c1+1]]) \
-            + length(points[swaplist2[c2-1]], points[swaplist2[c2]]) + length(points[swaplist2[c2]], points[swaplist2[c2+1]])
-    cost2 = length(points[swaplist1[c1-1]], points[swaplist2[c2]]) + length(points[swaplist2[c2]], points[swaplist1[c1+1]]) \
-            + length(points[swaplist2[c2-1]], points[swaplist1[c1]]) + length(points[swaplist1[c1]], points[swaplist2[c2+1]])
+    cost1 = dist[swaplist1[c1-1], swaplist1[c1]] + dist[swaplist1[c1], swaplist1[c1+1]] \
+            + dist[swaplist2[c2-1], swaplist2[c2]] + dist[swaplist2[c2], swaplist2[c2+1]]
+    cost2 = dist[swaplist1[c1-1], swaplist2[c2]] + dist[swaplist2[c2], swaplist1[c1+1]] \
+            + dist[swaplist2[c2-1], swaplist1[c1]] + dist[swaplist1[c1], swaplist2[c2+1]]
     diff_cost = cost2 - cost1
     
-    n = len(points)
+    n = len(dist)
     k = obj/n/5
     bkt = -diff_cost/(k*t)
     bkt_max = 708. # set a maximum for exponent
@@ -141,18 +196,18 @@ def rand_interswap(vehicle_t, points, vc, obj, t):
     return obj                
 
 
-def rand_swap(vehicle_t, points, vc, obj, t):
+def rand_swap(vehicle_t, dist, vc, obj, t):
     # Swap orders of customers allocated to a vehicle
     swaplist = list(vehicle_t[vc[0][0]])
     swaplist = [0] + swaplist + [0]
     c1 = vc[0][1]  # c1 = 1 is the first customer on the vehicle 
     c2 = vc[1][1]
 
-    cost1 = length(points[swaplist[c1-1]], points[swaplist[c1]]) + length(points[swaplist[c2]], points[swaplist[c2+1]])
-    cost2 = length(points[swaplist[c1-1]], points[swaplist[c2]]) + length(points[swaplist[c1]], points[swaplist[c2+1]])
+    cost1 = dist[swaplist[c1-1], swaplist[c1]] + dist[swaplist[c2], swaplist[c2+1]]
+    cost2 = dist[swaplist[c1-1], swaplist[c2]] + dist[swaplist[c1], swaplist[c2+1]]
     diff_cost = cost2 - cost1
     
-    n = len(points)
+    n = len(dist)
     k = obj/n/5
     bkt = -diff_cost/(k*t)
     bkt_max = 708. # set a maximum for exponent
@@ -176,14 +231,14 @@ def rand_swap(vehicle_t, points, vc, obj, t):
 import copy
 
 
-def rand_insert(vehicle_t, points, vehicle_capacity, vc, obj, t):
+def rand_insert(vehicle_t, dist, vehicle_capacity, vc, obj, t):
     # Move a customer to a different running vehicle
     v1 = vc[0][0]
     c1 = vc[0][1] # c1 is the customer to be removed from v1
     tmplist = list(vehicle_t[v1])
     tmplist = [0] + tmplist + [0]
-    cost1 = length(points[tmplist[c1-1]], points[tmplist[c1]]) + length(points[tmplist[c1]], points[tmplist[c1+1]])
-    cost2 = length(points[tmplist[c1-1]], points[tmplist[c1+1]])
+    cost1 = dist[tmplist[c1-1], tmplist[c1]] + dist[tmplist[c1], tmplist[c1+1]]
+    cost2 = dist[tmplist[c1-1], tmplist[c1+1]]
     diff_cost = cost2 - cost1
     
     v2 = vc[1][0]
@@ -196,13 +251,13 @@ def rand_insert(vehicle_t, points, vehicle_capacity, vc, obj, t):
     if m == 0: # add customer c1 to v2 before c2
 
         tmplist.insert(c2, vehicle_t[v1][c1-1])
-        cost1 = length(points[tmplist[c2-1]], points[tmplist[c2+1]])
-        cost2 = length(points[tmplist[c2-1]], points[tmplist[c2]]) + length(points[tmplist[c2]], points[tmplist[c2+1]])
+        cost1 = dist[tmplist[c2-1], tmplist[c2+1]]
+        cost2 = dist[tmplist[c2-1], tmplist[c2]] + dist[tmplist[c2], tmplist[c2+1]]
     else: # add customer c1 to v2 after c2
 
         tmplist.insert(c2+1, vehicle_t[v1][c1-1])
-        cost1 = length(points[tmplist[c2]], points[tmplist[c2+2]])
-        cost2 = length(points[tmplist[c2]], points[tmplist[c2+1]]) + length(points[tmplist[c2+1]], points[tmplist[c2+2]])
+        cost1 = dist[tmplist[c2], tmplist[c2+2]]
+        cost2 = dist[tmplist[c2], tmplist[c2+1]] + dist[tmplist[c2+1], tmplist[c2+2]]
 
     diff_cost += cost2 - cost1
     
@@ -227,13 +282,13 @@ def rand_insert(vehicle_t, points, vehicle_capacity, vc, obj, t):
         if len(vehicle_tmp[v1]) == 0:
             vehicle_tmp.remove(vehicle_tmp[v1])
 
-        obj_tmp = kopt2(vehicle_tmp,points,obj_tmp) # use 2-opt method
+        obj_tmp = kopt2(vehicle_tmp,dist,obj_tmp) # use 2-opt method
     
         diff_cost = obj_tmp - obj
     
     #return obj
     
-    n = len(points)
+    n = len(dist)
     k = obj/n/5
     bkt = -diff_cost/(k*t)
     bkt_max = 708. # set a maximum for exponent
@@ -267,15 +322,15 @@ def rand_insert(vehicle_t, points, vehicle_capacity, vc, obj, t):
             vehicle_t.remove(vehicle_t[v1])
     return obj
 
-def rand_addvehicle(vehicle_t, points, v, c, obj, t):
+def rand_addvehicle(vehicle_t, dist, v, c, obj, t):
     # Move customer to an empty vehicle
     tmplist = list(vehicle_t[v])
     tmplist = [0] + tmplist + [0]
-    cost1 = length(points[tmplist[c-1]], points[tmplist[c]]) + length(points[tmplist[c]], points[tmplist[c+1]])
-    cost2 = length(points[tmplist[c-1]], points[tmplist[c+1]])
+    cost1 = dist[tmplist[c-1], tmplist[c]] + dist[tmplist[c], tmplist[c+1]]
+    cost2 = dist[tmplist[c-1], tmplist[c+1]]
     diff_cost = cost2 - cost1
     
-    diff_cost += 2.0 * length(points[0], points[tmplist[c]])
+    diff_cost += 2.0 * dist[0, tmplist[c]]
     
     # make a copy of vehicle tours to find the best route for the assignment
     vehicle_tmp = copy.deepcopy(vehicle_t)
@@ -291,12 +346,12 @@ def rand_addvehicle(vehicle_t, points, v, c, obj, t):
     if len(vehicle_tmp[v]) == 0:
         vehicle_tmp.remove(vehicle_tmp[v])
 
-    obj_tmp = kopt2(vehicle_tmp,points,obj_tmp) # use 2-opt method
+    obj_tmp = kopt2(vehicle_tmp,dist,obj_tmp) # use 2-opt method
     
     diff_cost = obj_tmp - obj
     
     
-    n = len(points)
+    n = len(dist)
     k = obj/n/5
     bkt = -diff_cost/(k*t)
     bkt_max = 708. # set a maximum for exponent
@@ -326,8 +381,8 @@ def rand_addvehicle(vehicle_t, points, v, c, obj, t):
     
     return obj
     
-def rand_move(vehicle_t, points, customers, vehicle_count, vehicle_capacity, obj, t):
-    n = len(points)
+def rand_move(vehicle_t, dist, demand, vehicle_count, vehicle_capacity, obj, t):
+    n = len(dist)
     c1 = random.randrange(0,n)
     c2 = c1
     while (c2 == c1):
@@ -349,24 +404,22 @@ def rand_move(vehicle_t, points, customers, vehicle_count, vehicle_capacity, obj
             # Swap orders of customers allocated to a running vehicle
             [ c1, c2 ] = sorted([c1,c2])
             vc = [[v1, c1], [v2, c2]]
-            obj = rand_swap(vehicle_t, points, vc, obj, t)
+            obj = rand_swap(vehicle_t, dist, vc, obj, t)
         else:
             # Swap customers allocated to different vehicles if capacity allowed
             vc = [[v1, c1], [v2, c2]]
             #print "vc = ", vc
-            capacity_used = 0
-            for j in range(0, len(vehicle_t[v2])):
-                capacity_used += customers[vehicle_t[v2][j]].demand
+            capacity_used = demand[vehicle_t[v2]].sum()
+            d1 = demand[vehicle_t[v1][c1-1]]
+            d2 = demand[vehicle_t[v2][c2-1]]
 
-            if customers[vehicle_t[v1][c1-1]].demand <= (vehicle_capacity - capacity_used):
-                obj = rand_insert(vehicle_t, points, vehicle_capacity, vc, obj, t)
+            if d1 <= (vehicle_capacity - capacity_used):
+                obj = rand_insert(vehicle_t, dist, vehicle_capacity, vc, obj, t)
             else:
-                if (customers[vehicle_t[v1][c1-1]].demand - customers[vehicle_t[v2][c2-1]].demand) <= (vehicle_capacity - capacity_used):
-                    capacity_used = 0
-                    for j in range(0, len(vehicle_t[v1])):
-                        capacity_used += customers[vehicle_t[v1][j]].demand
-                    if (customers[vehicle_t[v2][c2-1]].demand - customers[vehicle_t[v1][c1-1]].demand) <= (vehicle_capacity - capacity_used):
-                        obj = rand_interswap(vehicle_t, points, vc, obj, t)
+                if (d1 - d2) <= (vehicle_capacity - capacity_used):
+                    capacity_used = demand[vehicle_t[v1]].sum()
+                    if (d2 - d1) <= (vehicle_capacity - capacity_used):
+                        obj = rand_interswap(vehicle_t, dist, vc, obj, t)
     else:
         # Move customer from v1 to v2 if v1 has more than one customer and there is an empty vehicle v2
         [ c1, c2 ] = sorted([c1,c2])
@@ -375,54 +428,218 @@ def rand_move(vehicle_t, points, customers, vehicle_count, vehicle_capacity, obj
             v2 += 1
             
         if (len(vehicle_t) < vehicle_count) & (len(vehicle_t[v1]) > 1): # if there is an empty vehicle
-            obj = rand_addvehicle(vehicle_t, points, v2, c2, obj, t)
+            obj = rand_addvehicle(vehicle_t, dist, v2, c2, obj, t)
     
     return obj
 
-def solve_it(input_data):
+# Batch moves
+# Instead of one random move per call, a block of random relocate (move a
+# customer next to a customer of another vehicle) and exchange (swap two
+# customers of different vehicles) candidates is evaluated at once with
+# numpy over flat arrays of the routes. A move only changes its two
+# routes, so moves on disjoint routes can all be applied and their cost
+# changes stay exact.
+
+class RouteArrays(object):
+    # Flat arrays of vehicle_t: the vehicle, previous and next location of
+    # each customer (0 is the depot at both ends), and the load of each
+    # vehicle. vehicle_t is changed in place by the apply methods.
+    def __init__(self, vehicle_t, demand):
+        n = len(demand)
+        self.vehicle_t = vehicle_t
+        self.demand = numpy.asarray(demand)
+        self.route = numpy.zeros(n, dtype=int)
+        self.prev = numpy.zeros(n, dtype=int)
+        self.next = numpy.zeros(n, dtype=int)
+        self.route[0] = -1
+        self.rebuild()
+
+    def rebuild(self):
+        self.load = numpy.zeros(len(self.vehicle_t), dtype=self.demand.dtype)
+        for v in range(len(self.vehicle_t)):
+            self.set_route(v)
+
+    def set_route(self, v):
+        tour = self.vehicle_t[v]
+        if len(tour) == 0:
+            self.load[v] = 0
+            return
+        self.route[tour] = v
+        self.prev[tour] = [0] + tour[:-1]
+        self.next[tour] = tour[1:] + [0]
+        self.load[v] = self.demand[tour].sum()
+
+    def relocate(self, c, a, b):
+        # Move customer c between a and b (a or b may be the depot)
+        v1 = self.route[c]
+        v2 = self.route[b] if a == 0 else self.route[a]
+        self.vehicle_t[v1].remove(c)
+        tour = self.vehicle_t[v2]
+        if a == 0:
+            tour.insert(0, c)
+        else:
+            tour.insert(tour.index(a) + 1, c)
+        self.set_route(v1)
+        self.set_route(v2)
+
+    def exchange(self, c1, c2):
+        v1 = self.route[c1]
+        v2 = self.route[c2]
+        tour1 = self.vehicle_t[v1]
+        tour2 = self.vehicle_t[v2]
+        i1 = tour1.index(c1)
+        i2 = tour2.index(c2)
+        tour1[i1], tour2[i2] = c2, c1
+        self.set_route(v1)
+        self.set_route(v2)
+
+    def drop_empty(self):
+        # Remove vehicles left without customers
+        if len(self.load) > 0 and self.load.min() == 0:
+            self.vehicle_t[:] = [tour for tour in self.vehicle_t if len(tour) > 0]
+            self.rebuild()
+
+def batch_moves(ra, dist, vehicle_capacity, nbatch):
+    # Draw nbatch relocate and nbatch exchange candidates and return the
+    # capacity feasible ones as arrays (kind, c, a, b, diff_cost), where
+    # kind is 0 for relocate (c goes between a and b) and 1 for exchange
+    # (c and a swap, b is unused).
+    n = len(ra.route)
+    route = ra.route
+    prev = ra.prev
+    nxt = ra.next
+    demand = ra.demand
+    load = ra.load
+
+    # Relocate c before or after p
+    c = numpy.random.randint(1, n, nbatch)
+    p = numpy.random.randint(1, n, nbatch)
+    after = numpy.random.randint(0, 2, nbatch) == 1
+    a = numpy.where(after, p, prev[p])
+    b = numpy.where(after, nxt[p], p)
+    ok = (route[c] != route[p]) & (load[route[p]] + demand[c] <= vehicle_capacity)
+    c, a, b = c[ok], a[ok], b[ok]
+    pc = prev[c]
+    nc = nxt[c]
+    diff_r = dist_pairs(dist, pc, nc) - dist_pairs(dist, pc, c) - dist_pairs(dist, c, nc) \
+             + dist_pairs(dist, a, c) + dist_pairs(dist, c, b) - dist_pairs(dist, a, b)
+
+    # Exchange c1 and c2
+    c1 = numpy.random.randint(1, n, nbatch)
+    c2 = numpy.random.randint(1, n, nbatch)
+    v1 = route[c1]
+    v2 = route[c2]
+    d = demand[c2] - demand[c1]
+    ok = (v1 != v2) & (load[v1] + d <= vehicle_capacity) & (load[v2] - d <= vehicle_capacity)
+    c1, c2 = c1[ok], c2[ok]
+    p1, n1, p2, n2 = prev[c1], nxt[c1], prev[c2], nxt[c2]
+    diff_x = dist_pairs(dist, p1, c2) + dist_pairs(dist, c2, n1) + dist_pairs(dist, p2, c1) + dist_pairs(dist, c1, n2) \
+             - dist_pairs(dist, p1, c1) - dist_pairs(dist, c1, n1) - dist_pairs(dist, p2, c2) - dist_pairs(dist, c2, n2)
+
+    kind = numpy.concatenate([numpy.zeros(len(c), dtype=int), numpy.ones(len(c1), dtype=int)])
+    return (kind, numpy.concatenate([c, c1]), numpy.concatenate([a, c2]),
+            numpy.concatenate([b, numpy.zeros(len(c1), dtype=int)]), numpy.concatenate([diff_r, diff_x]))
+
+def apply_moves(ra, moves, order):
+    # Apply the moves with indices in order, skipping those that touch a
+    # vehicle already changed. Return the total change of travel distance.
+    kind, c, a, b, diff = moves
+    route = ra.route
+    touched = set()
+    diff_cost = 0.
+    for m in order:
+        v1 = route[c[m]]
+        v2 = route[a[m]] if (kind[m] == 1 or a[m] != 0) else route[b[m]]
+        if v1 in touched or v2 in touched:
+            continue
+        touched.add(v1)
+        touched.add(v2)
+        if kind[m] == 0:
+            ra.relocate(c[m], a[m], b[m])
+        else:
+            ra.exchange(c[m], a[m])
+        diff_cost += diff[m]
+    ra.drop_empty()
+    return diff_cost
+
+def batch_anneal(ra, dist, vehicle_capacity, obj, t, nbatch=1000):
+    # Annealing step over a block of candidates, with the same acceptance
+    # probability as the single moves. Accepted moves are applied in random
+    # order as long as their vehicles are untouched.
+    moves = batch_moves(ra, dist, vehicle_capacity, nbatch)
+    diff = moves[4]
+    k = obj/len(ra.route)/5
+    bkt = numpy.clip(-diff/(k*t), -708., 708.)
+    pf = numpy.exp(bkt)
+    p = pf/(pf+1.)
+    accepted = numpy.nonzero(numpy.random.random(len(diff)) <= p)[0]
+    return obj + apply_moves(ra, moves, accepted)
+
+def batch_descent(ra, dist, vehicle_capacity, obj, nbatch=1000, patience=20, deadline=None):
+    # Steepest descent: apply the improving moves of each block, best first,
+    # until patience blocks in a row bring no improvement (or the deadline,
+    # a time.time() value, passes).
+    idle = 0
+    while idle < patience:
+        if deadline is not None and time.time() > deadline:
+            break
+        moves = batch_moves(ra, dist, vehicle_capacity, nbatch)
+        diff = moves[4]
+        improving = numpy.nonzero(diff < -1.e-9)[0]
+        if len(improving) == 0:
+            idle += 1
+            continue
+        idle = 0
+        obj += apply_moves(ra, moves, improving[numpy.argsort(diff[improving])])
+    return obj
+
+def polish(vehicle_t, dist, demand, vehicle_capacity, obj, callback=None, deadline=None):
+    # Batch descent on vehicle_t in place, then 2-opt within the vehicles
+    # if there is time left before the deadline
+    obj_new = batch_descent(RouteArrays(vehicle_t, demand), dist, vehicle_capacity, obj, deadline=deadline)
+    if deadline is None or time.time() < deadline:
+        obj_new = kopt2(vehicle_t, dist, obj_new)
+    if obj_new < obj - 1.e-9 and callback is not None:
+        callback(vehicle_t, obj_new)
+    return obj_new
+
+def read_vrp(input_data):
     # Parse the input data (N: number of locations including warehouse 0, V: number of vehicle, c: vehicle capacity, d_i: demand of customer i, [x,y]: coordinates):
     # N V c
     # d_0 x_0 y_0
     # d_1 x_1 y_1
     # ...
     # d_N-1, x_N-1, y_N-1
+    # input_data is the text or the arrays from loader.load_instance
     
-    lines = input_data.split('\n')
-
-    parts = lines[0].split()
-    customer_count = int(parts[0])
-    vehicle_count = int(parts[1])
-    vehicle_capacity = int(parts[2])
+    header, data = loader.instance_arrays(input_data, 3, 3)
+    customer_count, vehicle_count, vehicle_capacity = header
     
-    customers = []
-    points = []
-    for i in range(1, customer_count+1):
-        line = lines[i]
-        parts = line.split()
-        customers.append(Customer(i-1, int(parts[0]), float(parts[1]), float(parts[2])))
-        points.append(Point(float(parts[1]), float(parts[2])))
+    # Flat arrays of demand and coordinates, indexed by location
+    demand = data[:, 0].astype(int)
+    x = data[:, 1]
+    y = data[:, 2]
+    return vehicle_count, vehicle_capacity, demand, x, y
 
+def greedy_init(dist, demand, vehicle_count, vehicle_capacity, deadline=None):
+    # Considering no capacity constraint and start from origin then connect
+    # to nearest neighbor (like traveling salesman problem), then fill the
+    # vehicles in tour order. Return None if some customers are left over,
+    # or if the deadline passes while building the tour.
     #the depot is always the first customer in the input
-    depot = customers[0]
-    templist = range(0, customer_count) 
-    
-    # Considering no capacity constraint and start from origin then connect to nearest neighbor (like traveling salesman problem)
-    
-    templist = ori_init(templist, points)
+    templist = ori_init(range(0, len(demand)), dist, deadline)
+    if templist is None:
+        return None
     templist.remove(0)
     vehicle_tours = []
-    v_used = 1
-    cust_on_vehi = []
-    capacity_remaining = vehicle_capacity
     
     for v in range(vehicle_count):
         capacity_remaining = vehicle_capacity
         cust_on_vehi = []
         for i in templist:
-            if capacity_remaining >= customers[i].demand:
+            if capacity_remaining >= demand[i]:
                 cust_on_vehi.append(i)
-                capacity_remaining -= customers[i].demand
-            #else:
+                capacity_remaining -= demand[i]
         if len(cust_on_vehi) > 0:
             vehicle_tours.append(cust_on_vehi)
             
@@ -430,35 +647,590 @@ def solve_it(input_data):
             templist.remove(cust_on_vehi[i])
     
     if templist != []:
-        print "Error! Some customers were not on a vehicle route!"
-        return 0
+        return None
+    return vehicle_tours
+
+import heapq
+import time
+
+def savings_init(dist, demand, vehicle_count, vehicle_capacity, max_candidates=200, deadline=None):
+    # Clarke-Wright savings. Start with one route per customer and merge the
+    # two routes ending at i and j in decreasing order of the saving
+    # s_ij = d_0i + d_0j - d_ij, as long as the merged load fits a vehicle.
+    # The candidates of each customer i are the j > i with the largest
+    # savings, at most max_candidates of them, sorted once; a heap holds the
+    # next candidate of every customer. Routes are kept as union-find sets
+    # with the load at the root, and as links between neighbouring
+    # customers. Return None if more than vehicle_count routes are needed,
+    # or if the deadline (a time.time() value) passes first.
+    n = len(demand)
+    d0 = dist_row(dist, 0)
+    cand = [None] * n
+    heap = []
+    for i in range(1, n-1):
+        if (i % 100 == 0) and deadline is not None and time.time() > deadline:
+            return None
+        sav = d0[i] + d0[i+1:] - dist_row(dist, i)[i+1:]
+        if len(sav) > max_candidates:
+            best = numpy.argpartition(-sav, max_candidates)[:max_candidates]
+        else:
+            best = numpy.arange(len(sav))
+        best = best[numpy.argsort(-sav[best], kind='mergesort')]
+        best = best[sav[best] > 0]
+        if len(best) > 0:
+            cand[i] = (best + i+1, sav[best])
+            heapq.heappush(heap, (-cand[i][1][0], i, 0))
+
+    parent = range(n)
+    load = [int(d) for d in demand]
+    links = [[] for i in range(n)] # customer neighbours, the depot is implied
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    npop = 0
+    while heap:
+        npop += 1
+        if (npop % 10000 == 0) and deadline is not None and time.time() > deadline:
+            return None
+        s, i, k = heapq.heappop(heap)
+        j = int(cand[i][0][k])
+        if k+1 < len(cand[i][0]):
+            heapq.heappush(heap, (-cand[i][1][k+1], i, k+1))
+        if len(links[i]) > 1 or len(links[j]) > 1: # not at a route end
+            continue
+        ri = find(i)
+        rj = find(j)
+        if ri == rj or load[ri] + load[rj] > vehicle_capacity:
+            continue
+        parent[rj] = ri
+        load[ri] += load[rj]
+        links[i].append(j)
+        links[j].append(i)
+
+    # Walk each route from one of its ends
+    vehicle_tours = []
+    visited = [False] * n
+    for i in range(1, n):
+        if visited[i] or len(links[i]) > 1:
+            continue
+        tour = [i]
+        visited[i] = True
+        prev = 0
+        c = i
+        while True:
+            nxt = [q for q in links[c] if q != prev]
+            if len(nxt) == 0:
+                break
+            prev = c
+            c = nxt[0]
+            tour.append(c)
+            visited[c] = True
+        vehicle_tours.append(tour)
+
+    if len(vehicle_tours) > vehicle_count:
+        return None
+    return vehicle_tours
+
+def sweep_init(dist, demand, x, y, vehicle_count, vehicle_capacity, starts=10, deadline=None):
+    # Sweep: order customers by polar angle around the depot and cut the
+    # order into routes whenever the next customer does not fit the
+    # vehicle. Each route is then improved with 2-opt. The sweep is tried
+    # from several starting angles and the shortest result with at most
+    # vehicle_count routes is returned, or None if there is none. After the
+    # deadline (a time.time() value), no more starting angles are tried.
+    n = len(demand)
+    angle = numpy.arctan2(y[1:] - y[0], x[1:] - x[0])
+    order = (numpy.argsort(angle, kind='mergesort') + 1).tolist()
+    obj_min = 1.e20
+    solution_min = None
+    for s in range(min(starts, n-1)):
+        if s > 0 and deadline is not None and time.time() > deadline:
+            break
+        shift = s * (n-1) // min(starts, n-1)
+        vehicle_tours = []
+        tour = []
+        capacity_remaining = vehicle_capacity
+        for c in order[shift:] + order[:shift]:
+            if demand[c] > capacity_remaining:
+                vehicle_tours.append(tour)
+                tour = []
+                capacity_remaining = vehicle_capacity
+            tour.append(c)
+            capacity_remaining -= demand[c]
+        if len(tour) > 0:
+            vehicle_tours.append(tour)
+        if len(vehicle_tours) > vehicle_count:
+            continue
+        obj = kopt2(vehicle_tours, dist, tour_length(vehicle_tours, dist))
+        if obj_min > obj:
+            obj_min = obj
+            solution_min = vehicle_tours
+    return solution_min
+
+def first_fit_init(dist, demand, x, y, vehicle_count, vehicle_capacity):
+    # Last resort for tight capacities: pack customers into vehicles first
+    # fit in decreasing order of demand, then visit each vehicle's customers
+    # in order of angle around the depot, improved with 2-opt. Return None
+    # if the customers do not fit in vehicle_count vehicles.
+    loads = []
+    vehicle_tours = []
+    for c in (numpy.argsort(-demand[1:], kind='mergesort') + 1).tolist():
+        for v in range(len(loads)):
+            if loads[v] + demand[c] <= vehicle_capacity:
+                loads[v] += demand[c]
+                vehicle_tours[v].append(c)
+                break
+        else:
+            if len(loads) == vehicle_count:
+                return None
+            loads.append(demand[c])
+            vehicle_tours.append([c])
+    angle = numpy.arctan2(y - y[0], x - x[0])
+    for tour in vehicle_tours:
+        tour.sort(key=lambda c: angle[c])
+    kopt2(vehicle_tours, dist, tour_length(vehicle_tours, dist))
+    return vehicle_tours
+
+def pack_routes(vehicle_t):
+    # Compact form of the routes for sending between processes: one int32
+    # array of the customers of each vehicle, each route followed by a 0
+    flat = []
+    for tour in vehicle_t:
+        flat.extend(tour)
+        flat.append(0)
+    return numpy.array(flat, dtype=numpy.int32)
+
+def unpack_routes(flat):
+    vehicle_t = []
+    tour = []
+    for c in flat.tolist():
+        if c == 0:
+            vehicle_t.append(tour)
+            tour = []
+        else:
+            tour.append(c)
+    return vehicle_t
+
+# Instance data of a replica worker process, set once by replica_init
+replica_data = {}
+
+def replica_init(dist, demand, vehicle_count, vehicle_capacity):
+    replica_data['dist'] = dist
+    replica_data['demand'] = demand
+    replica_data['vehicle_count'] = vehicle_count
+    replica_data['vehicle_capacity'] = vehicle_capacity
+
+def replica_run(args):
+    # Run nmove random moves at temperature t on one replica. Return the
+    # final routes and objective, and the best routes seen on the way.
+    flat, obj, t, nmove, seed = args
+    random.seed(seed)
+    dist = replica_data['dist']
+    demand = replica_data['demand']
+    vehicle_count = replica_data['vehicle_count']
+    vehicle_capacity = replica_data['vehicle_capacity']
+    vehicle_t = unpack_routes(flat)
+    obj_min = obj
+    solution_min = flat
+    for i in range(nmove):
+        obj = rand_move(vehicle_t, dist, demand, vehicle_count, vehicle_capacity, obj, t)
+        if obj_min > obj:
+            obj_min = obj
+            solution_min = pack_routes(vehicle_t)
+    return pack_routes(vehicle_t), obj, solution_min, obj_min
+
+def parallel_tempering(vehicle_tours, dist, demand, vehicle_count, vehicle_capacity,
+                       replicas=None, t_max=2., t_min=0.005, rounds=200, nmove=20000,
+                       deadline=None, callback=None):
+    # Replica exchange: run one annealing chain per temperature on a pool of
+    # processes. After every round of nmove moves, neighbouring replicas
+    # swap configurations with the Metropolis criterion, so good routes
+    # found at high temperature sink to the cold replicas.
+    # With a deadline (a time.time() value), rounds continue until the
+    # deadline instead, with nmove cut down so the last round ends on time.
+    import multiprocessing
+    if replicas is None:
+        replicas = multiprocessing.cpu_count()
+    replicas = max(replicas, 2)
+    temps = [t_max * (t_min/t_max)**(float(r)/(replicas-1)) for r in range(replicas)]
+
+    obj = tour_length(vehicle_tours, dist)
+    flats = [pack_routes(vehicle_tours)] * replicas
+    objs = [obj] * replicas
+    obj_min = obj
+    solution_min = copy.deepcopy(vehicle_tours)
+    n = len(dist)
+
+    pool = multiprocessing.Pool(min(replicas, multiprocessing.cpu_count()), replica_init,
+                                (dist, demand, vehicle_count, vehicle_capacity))
+    try:
+        r = 0
+        rate = None # moves per second of each replica
+        while True:
+            if deadline is None:
+                if r == rounds: break
+                nround = nmove
+            else:
+                remaining = deadline - time.time()
+                if rate is None:
+                    nround = nmove // 10
+                else:
+                    nround = min(nmove, int(rate * remaining))
+                if nround < 100: break
+            start = time.time()
+            tasks = [(flats[i], objs[i], temps[i], nround, random.randrange(1 << 30)) for i in range(replicas)]
+            results = pool.map(replica_run, tasks)
+            rate = nround / max(time.time() - start, 1.e-6)
+            improved = False
+            for i in range(replicas):
+                flats[i], objs[i], flat_min, obj_r = results[i]
+                if obj_min > obj_r:
+                    obj_min = obj_r
+                    solution_min = unpack_routes(flat_min)
+                    improved = True
+            if improved and callback is not None:
+                callback(solution_min, obj_min)
+
+            # Swap configurations of neighbouring temperatures, alternating
+            # between even and odd pairs each round
+            k = obj_min/n/5 # same energy scale as the moves
+            swapped = 0
+            for i in range(r % 2, replicas-1, 2):
+                bkt = (1./(k*temps[i]) - 1./(k*temps[i+1])) * (objs[i] - objs[i+1])
+                if bkt >= 0 or random.random() < math.exp(bkt):
+                    flats[i], flats[i+1] = flats[i+1], flats[i]
+                    objs[i], objs[i+1] = objs[i+1], objs[i]
+                    swapped += 1
+            if (r % 10 == 0):
+                print "Round", r, " swaps:", swapped, " minimum so far:", obj_min
+            r += 1
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return obj_min, solution_min
+
+# Large neighbourhood search
+# Each step ruins the routes by taking out a group of related customers and
+# recreates them by regret insertion, then accepts or rejects the result.
+# One step moves many customers at once, which single-customer moves in a
+# full vehicle cannot do without passing through infeasible routes.
+#   ruin:     'spatial' (a customer and its nearest customers), 'route'
+#             (whole routes, nearest to a random customer first) or
+#             'random' customers
+#   recreate: regret-2 insertion. The cheapest insertion of every removed
+#             customer into every route that has room for it is kept in a
+#             table; the customer whose best and second best routes differ
+#             most goes in first, and only the table column of the route it
+#             went into is computed again.
+#   accept:   'threshold' (anything within a fraction of the best, falling
+#             from threshold to 0) or 'sa' (Metropolis, with the temperature
+#             falling geometrically from t_max to t_min)
+
+ruin_modes = ['spatial', 'route', 'random']
+
+def insertion_costs(tour, customers, dist):
+    # Cheapest insertion of each customer (an index array) into tour, and
+    # the position it goes in at
+    nodes = [0] + tour + [0]
+    a = numpy.array(nodes[:-1])
+    b = numpy.array(nodes[1:])
+    c = customers[:, None]
+    cost = dist_pairs(dist, c, a[None, :]) + dist_pairs(dist, c, b[None, :]) - dist_pairs(dist, a, b)[None, :]
+    pos = cost.argmin(axis=1)
+    return cost[numpy.arange(len(customers)), pos], pos
+
+def ruin(routes, dist, size, mode):
+    # Take size customers out of routes (in place, dropping emptied routes).
+    # Return the removed customers.
+    n = len(dist)
+    size = min(size, n-1)
+    if mode == 'random':
+        removed = random.sample(range(1, n), size)
+    else:
+        seed = random.randrange(1, n)
+        near = numpy.argsort(dist_row(dist, seed), kind='mergesort').tolist()
+        near.remove(0)
+        if mode == 'spatial':
+            removed = near[:size]
+        else:
+            route_of = {}
+            for r, tour in enumerate(routes):
+                for c in tour:
+                    route_of[c] = r
+            removed = []
+            taken = set()
+            for c in near:
+                if len(removed) >= size:
+                    break
+                if route_of[c] not in taken:
+                    taken.add(route_of[c])
+                    removed.extend(routes[route_of[c]])
+    removed_set = set(removed)
+    routes[:] = [tour for tour in ([c for c in tour if c not in removed_set] for tour in routes) if tour]
+    return removed
+
+def regret_insert(routes, removed, dist, demand, vehicle_count, vehicle_capacity):
+    # Insert the removed customers into routes (in place) by regret-2
+    # insertion, opening new routes while there are spare vehicles. Return
+    # False if some customer fits nowhere.
+    customers = numpy.array(removed, dtype=numpy.int64)
+    m = len(customers)
+    dem = demand[customers]
+    loads = [demand[tour].sum() for tour in routes]
+    new_route = 2. * dist_row(dist, 0)[customers] # cost of a route of its own
+    cost = numpy.empty((m, 0))
+    pos = numpy.empty((m, 0), dtype=numpy.int64)
+    left = numpy.ones(m, dtype=bool)
+
+    def column(r):
+        col = numpy.empty(m)
+        col.fill(numpy.inf)
+        cpos = numpy.zeros(m, dtype=numpy.int64)
+        fits = left & (loads[r] + dem <= vehicle_capacity)
+        if fits.any():
+            col[fits], cpos[fits] = insertion_costs(routes[r], customers[fits], dist)
+        return col, cpos
+
+    cols = [column(r) for r in range(len(routes))]
+    if cols:
+        cost = numpy.column_stack([col for col, cpos in cols])
+        pos = numpy.column_stack([cpos for col, cpos in cols])
+
+    for step in range(m):
+        options = cost
+        if len(routes) < vehicle_count:
+            options = numpy.column_stack((cost, new_route))
+        if options.shape[1] == 0:
+            return False
+        options = options[left]
+        if options.shape[1] > 1:
+            two = numpy.partition(options, 1, axis=1)
+            best, second = two[:, 0], two[:, 1]
+        else:
+            best = options[:, 0]
+            second = numpy.empty(len(best))
+            second.fill(numpy.inf)
+        if numpy.isinf(best).any():
+            return False
+        # Largest regret first; a customer with one route left has an
+        # infinite regret and goes in before that route fills up
+        regret = numpy.where(numpy.isinf(second), numpy.inf, second - best)
+        k = int(numpy.lexsort((best, -regret))[0])
+        i = int(numpy.flatnonzero(left)[k])
+        r = int(options[k].argmin())
+        c = int(customers[i])
+        left[i] = False
+        if r == len(routes):
+            routes.append([c])
+            loads.append(dem[i])
+            col, cpos = column(r)
+            cost = numpy.column_stack((cost, col))
+            pos = numpy.column_stack((pos, cpos))
+        else:
+            routes[r].insert(pos[i, r], c)
+            loads[r] += dem[i]
+            cost[:, r], pos[:, r] = column(r)
+    return True
+
+def ruin_recreate(vehicle_tours, dist, demand, vehicle_count, vehicle_capacity, iterations=50000, deadline=None,
+                  callback=None, accept='threshold', threshold=0.05, t_max=0.2, t_min=0.005, min_ruin=5,
+                  max_ruin=30):
+    # Ruin and recreate from vehicle_tours for the given number of
+    # iterations, or until the deadline (a time.time() value) if given.
+    # Between min_ruin and max_ruin customers (at most 15% of them) are
+    # taken out each time. callback(solution_min, obj_min) is called when
+    # the best routes improve.
+    # Return the best travel distance and routes.
+    start = time.time()
+    n = len(demand)
+    current = [list(tour) for tour in vehicle_tours]
+    obj = tour_length(current, dist)
+    obj_min = obj
+    solution_min = copy.deepcopy(current)
+    largest = max(1, min(max_ruin, int(0.15 * (n-1))))
+    smallest = min(min_ruin, largest)
+    accepted = 0
+    i = 0
+    while True:
+        if deadline is not None:
+            frac = (time.time() - start) / max(deadline - start, 1.e-9)
+        else:
+            frac = float(i) / iterations
+        if frac >= 1:
+            break
+        if (i % 1000 == 0):
+            print "LNS iteration", i, " obj value:", obj, " minimum so far:", obj_min, " accepted:", accepted
+        i += 1
+
+        routes = [list(tour) for tour in current]
+        removed = ruin(routes, dist, random.randint(smallest, largest), random.choice(ruin_modes))
+        if not regret_insert(routes, removed, dist, demand, vehicle_count, vehicle_capacity):
+            continue
+        obj_new = tour_length(routes, dist)
+
+        diff = obj_new - obj
+        if accept == 'threshold':
+            ok = obj_new < obj_min * (1. + threshold * (1. - frac))
+        else:
+            t = t_max * (t_min/t_max)**frac
+            k = obj/n # average distance between adjacent locations
+            ok = diff <= 0 or random.random() < math.exp(-diff/(k*t))
+        if ok:
+            current = routes
+            obj = obj_new
+            accepted += 1
+            if obj_min > obj + 1.e-9:
+                obj_min = obj
+                solution_min = copy.deepcopy(current)
+                if callback is not None:
+                    callback(solution_min, obj_min)
+
+    return obj_min, solution_min
+
+def print_routes(solution_min, obj_min):
+    print "Routes for minimize travel distance of vehicles:"
+    for v in range(0, len(solution_min)):
+        print "Vehicle", v, " :", ' '.join(str(cus) for cus in solution_min[v])
+    print "Travel distance: ", obj_min
+
+def write_routes(file_name, solution_min, obj_min):
+    # Write the travel distance and one line of customers per vehicle. The
+    # file is replaced in one step, so a reader never sees a partial file.
+    tmp_file_name = file_name + '.tmp'
+    tmp_file = open(tmp_file_name, 'w')
+    tmp_file.write(str(obj_min) + '\n')
+    for tour in solution_min:
+        tmp_file.write(' '.join(map(str, tour)) + '\n')
+    tmp_file.close()
+    os.rename(tmp_file_name, file_name)
+
+def feasible_routes(vehicle_t, demand, vehicle_count, vehicle_capacity):
+    # True if vehicle_t serves every customer exactly once within the fleet
+    # and the vehicle capacity
+    if len(vehicle_t) > vehicle_count or any(len(tour) == 0 for tour in vehicle_t):
+        return False
+    if sorted(c for tour in vehicle_t for c in tour) != range(1, len(demand)):
+        return False
+    return all(demand[tour].sum() <= vehicle_capacity for tour in vehicle_t)
+
+def solve_it(input_data, replicas=0, time_limit=None, callback=None, batch=True, init_routes=None, lns=False):
+    # replicas > 0 runs parallel tempering with that many replicas instead
+    # of the sequential annealing cycles.
+    # lns runs the large neighbourhood search (ruin_recreate) instead.
+    # time_limit is a wall-clock budget in seconds. Each temperature then
+    # runs for its share of the remaining time instead of a fixed number of
+    # moves, and the solver returns the best routes found when it runs out.
+    # callback(solution_min, obj_min) is called whenever the best routes
+    # improve (checked every 1000 moves).
+    # batch adds a block of batch moves every 1000 random moves, and a
+    # batch descent on the best routes at the end.
+    # init_routes are optional starting routes, e.g. the routes of a
+    # similar instance. They are used like the savings and sweep routes if
+    # they are feasible for this instance.
+    # Return the best travel distance and routes. Raise ValueError if the
+    # customers cannot all be put on the vehicles.
+    start = time.time()
+    deadline = None # end of the search; the last tenth of the time is for polish
+    end = None
+    if time_limit is not None:
+        deadline = start + 0.9 * time_limit
+        end = start + time_limit
+
+    vehicle_count, vehicle_capacity, demand, x, y = read_vrp(input_data)
+    dist = dist_matrix(x, y)
+
+    # Start from the shorter of the sweep and savings routes, and skip the
+    # high temperatures for them. Fall back to the greedy fill in tour
+    # order, then to first fit packing, if neither fits in the fleet.
+    # With a time limit, the constructors get half of it: the sweep always
+    # returns its first start, the others give up when the time is up, and
+    # the callback gets each better set of routes at once, so a stopped job
+    # has routes.
+    temperatures = [5., 4., 3., 2., 1.8, 1.5, 1.3, 1.2, 1.1, 1., 0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.2, 0.1, 0.05, 0.03, 0.02, 0.015, 0.01, 0.0075, 0.005]
+    build_end = None
+    if deadline is not None:
+        build_end = start + 0.5 * time_limit
+    vehicle_tours = None
+    if init_routes is not None:
+        init_routes = [list(tour) for tour in init_routes]
+        if not feasible_routes(init_routes, demand, vehicle_count, vehicle_capacity):
+            init_routes = None
+    constructors = [lambda: init_routes,
+                    lambda: sweep_init(dist, demand, x, y, vehicle_count, vehicle_capacity, deadline=build_end),
+                    lambda: savings_init(dist, demand, vehicle_count, vehicle_capacity, deadline=build_end)]
+    for construct in constructors:
+        tours = construct()
+        if tours is not None:
+            if vehicle_tours is None or tour_length(vehicle_tours, dist) > tour_length(tours, dist):
+                vehicle_tours = tours
+                if callback is not None:
+                    callback(copy.deepcopy(vehicle_tours), tour_length(vehicle_tours, dist))
+    if vehicle_tours is not None:
+        temperatures = [t for t in temperatures if t <= 1.]
+    else:
+        vehicle_tours = greedy_init(dist, demand, vehicle_count, vehicle_capacity, build_end)
+    if vehicle_tours is None:
+        vehicle_tours = first_fit_init(dist, demand, x, y, vehicle_count, vehicle_capacity)
+    if vehicle_tours is None:
+        raise ValueError('Some customers were not on a vehicle route')
     
     #print vehicle_tours
+    obj_min = tour_length(vehicle_tours, dist)
+    solution_min = copy.deepcopy(vehicle_tours)
+    print "Initial travel distance:", obj_min
+    if callback is not None:
+        callback(solution_min, obj_min)
     
-    obj_min = 1.e20
-    solution_min = []
+    if lns:
+        obj_min, solution_min = ruin_recreate(vehicle_tours, dist, demand, vehicle_count, vehicle_capacity,
+                                              deadline=deadline, callback=callback)
+        if batch:
+            obj_min = polish(solution_min, dist, demand, vehicle_capacity, obj_min, callback, end)
+        print_routes(solution_min, obj_min)
+        return obj_min, solution_min
+
+    if replicas > 0:
+        obj_min, solution_min = parallel_tempering(vehicle_tours, dist, demand, vehicle_count, vehicle_capacity, replicas,
+                                                   deadline=deadline, callback=callback)
+        if batch:
+            obj_min = polish(solution_min, dist, demand, vehicle_capacity, obj_min, callback, end)
+        print_routes(solution_min, obj_min)
+        return obj_min, solution_min
+
+    ncycle = 3
     # Start annealing cycle
-    for j in range(3):
+    for j in range(ncycle):
         print "Annealing cycle", j+1
-        obj = 0
         temp = 0
         # calculate the length of the tour
-        for tour in vehicle_tours:
-            obj += length(points[0], points[tour[0]])
-            for i in range(0, len(tour)-1):
-                obj += length(points[tour[i]], points[tour[i+1]])
-            obj += length(points[tour[-1]], points[0])
+        obj = tour_length(vehicle_tours, dist)
+        ra = RouteArrays(vehicle_tours, demand)
         
         nmove = 300000
         
         t = 1. # temperature-like scale, the smaller, the lower temperature
-        for t in [5., 4., 3., 2., 1.8, 1.5, 1.3, 1.2, 1.1, 1., 0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.2, 0.1, 0.05, 0.03, 0.02, 0.015, 0.01, 0.0075, 0.005]:
+        for it, t in enumerate(temperatures):
         #for t in [1]:
             converge = True
             print "T scale:", t, " minimum so far:", obj_min
+            stage_end = None
+            if deadline is not None:
+                # Share the remaining time among the remaining temperatures
+                stages_left = len(temperatures) - it + (ncycle-j-1) * len(temperatures)
+                stage_end = time.time() + (deadline - time.time()) / stages_left
+            improved = False
             # Random move
-            for i in range(nmove):
-                obj = rand_move(vehicle_tours, points, customers, vehicle_count, vehicle_capacity, obj, t)
+            i = 0
+            while (i < nmove) or (stage_end is not None):
+                obj = rand_move(vehicle_tours, dist, demand, vehicle_count, vehicle_capacity, obj, t)
+                if batch and (i % 1000 == 999):
+                    ra.rebuild()
+                    obj = batch_anneal(ra, dist, vehicle_capacity, obj, t)
                 if (i % 20000 == 0): print "Iteration", i, " obj value:", obj
                 
                 if (i % 20000 == 0):
@@ -468,27 +1240,54 @@ def solve_it(input_data):
                 if obj_min > obj:
                     obj_min = obj
                     solution_min = copy.deepcopy(vehicle_tours)
+                    improved = True
+
+                if (i % 1000 == 0):
+                    if improved and callback is not None:
+                        callback(solution_min, obj_min)
+                        improved = False
+                    if stage_end is not None and time.time() > stage_end:
+                        break
+                i += 1
+            if improved and callback is not None:
+                callback(solution_min, obj_min)
+            if stage_end is not None and abs(temp - obj) > 1.e-8:
+                converge = False # timed stages may be shorter than 20000 moves
             print
             temp = obj
             if converge: break
+            if deadline is not None and time.time() > deadline: break
+        if deadline is not None and time.time() > deadline: break
 
-    print "Routes for minimize travel distance of vehicles:"
-    for v in range(0, len(solution_min)):
-        print "Vehicle", v, " :", ' '.join(str(cus) for cus in solution_min[v])
-    print "Travel distance: ", obj_min
+    if batch:
+        obj_min = polish(solution_min, dist, demand, vehicle_capacity, obj_min, callback, end)
+    print_routes(solution_min, obj_min)
     
-    return
-
-import sys
+    return obj_min, solution_min
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        file_location = sys.argv[1].strip()
-        input_data_file = open(file_location, 'r')
-        input_data = ''.join(input_data_file.readlines())
-        input_data_file.close()
+    args = sys.argv[1:]
+    lns = '--lns' in args # large neighbourhood search instead of annealing
+    if lns:
+        args.remove('--lns')
+    if len(args) > 0:
+        file_location = args[0].strip()
+        input_data = loader.load_instance(file_location, 3, 3)
         print 'Solving:', file_location
-        solve_it(input_data)
+        replicas = 0
+        if len(args) > 1: # number of replicas for parallel tempering
+            replicas = int(args[1])
+        time_limit = None
+        if len(args) > 2: # time limit in seconds
+            time_limit = float(args[2])
+        callback = None
+        if len(args) > 3: # file to keep the best routes in
+            solution_file = args[3].strip()
+            callback = lambda solution, obj: write_routes(solution_file, solution, obj)
+        solve_it(input_data, replicas, time_limit, callback, lns=lns)
     else:
         print 'This test requires an input file. (For example: python solver.py vrp_20.txt)'
+        print 'Add a number of replicas to use parallel tempering. (For example: python solver.py vrp_20.txt 8)'
+        print 'Add a time limit in seconds and a file to keep the best routes in. (For example: python solver.py vrp_20.txt 0 60 best.txt)'
+        print 'Add --lns to use the large neighbourhood search instead of annealing. (For example: python solver.py --lns vrp_20.txt 0 60)'
 
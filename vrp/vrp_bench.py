@@ -0,0 +1,78 @@
+#!/usr/bin/python
+
+# Benchmark of random moves per second in the VRP annealer, comparing
+# distances computed on the fly (as the solver used to do) with the
+# precomputed distance matrix, and with batch moves.
+#
+# Usage: python vrp_bench.py [vrp_file ...]
+# Without arguments, vrp_21.txt and a few generated instances are used.
+
+import copy
+import random
+import sys
+import time
+
+import numpy
+
+import vrp
+
+def gen_vrp(n, seed=0):
+    # Random instance with n locations in a 1000 x 1000 square, depot in the
+    # middle. Enough vehicles are given so the greedy start is feasible.
+    rng = numpy.random.RandomState(seed)
+    demand = rng.randint(1, 30, n)
+    demand[0] = 0
+    x = rng.uniform(0., 1000., n)
+    y = rng.uniform(0., 1000., n)
+    x[0] = y[0] = 500.
+    vehicle_capacity = 200
+    vehicle_count = n // 4 + 1
+    return vehicle_count, vehicle_capacity, demand, x, y
+
+def moves_per_second(vehicle_tours, dist, demand, vehicle_count, vehicle_capacity, nmove, t=1.):
+    vehicle_t = copy.deepcopy(vehicle_tours)
+    obj = vrp.tour_length(vehicle_t, dist)
+    random.seed(1)
+    start = time.time()
+    for i in range(nmove):
+        obj = vrp.rand_move(vehicle_t, dist, demand, vehicle_count, vehicle_capacity, obj, t)
+    return nmove / (time.time() - start)
+
+def batch_moves_per_second(vehicle_tours, dist, demand, vehicle_capacity, nmove, t=1., nbatch=1000):
+    # Candidates evaluated per second by batch_anneal (relocate and
+    # exchange, nbatch of each per call)
+    vehicle_t = copy.deepcopy(vehicle_tours)
+    obj = vrp.tour_length(vehicle_t, dist)
+    ra = vrp.RouteArrays(vehicle_t, demand)
+    numpy.random.seed(1)
+    ncall = max(nmove // (2*nbatch), 1)
+    start = time.time()
+    for i in range(ncall):
+        obj = vrp.batch_anneal(ra, dist, vehicle_capacity, obj, t, nbatch)
+    return 2 * nbatch * ncall / (time.time() - start)
+
+def bench(name, vehicle_count, vehicle_capacity, demand, x, y, nmove=50000):
+    start = time.time()
+    dist = vrp.dist_matrix(x, y)
+    build = time.time() - start
+    random.seed(0)
+    vehicle_tours = vrp.greedy_init(dist, demand, vehicle_count, vehicle_capacity)
+    if vehicle_tours is None:
+        print name, ": greedy start is infeasible, skipped"
+        return
+    on_the_fly = vrp.PointDistance(x, y)
+    mps_old = moves_per_second(vehicle_tours, on_the_fly, demand, vehicle_count, vehicle_capacity, nmove)
+    mps_new = moves_per_second(vehicle_tours, dist, demand, vehicle_count, vehicle_capacity, nmove)
+    mps_batch = batch_moves_per_second(vehicle_tours, dist, demand, vehicle_capacity, 20*nmove)
+    print "%-12s n=%-6d matrix build %.3fs  on the fly %9.0f moves/s  matrix %9.0f moves/s  speedup %.2fx" \
+          % (name, len(demand), build, mps_old, mps_new, mps_new / mps_old),
+    print "  batch %9.0f moves/s  speedup %.1fx" % (mps_batch, mps_batch / mps_old)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        for file_location in sys.argv[1:]:
+            bench(file_location, *vrp.read_vrp(vrp.loader.load_instance(file_location, 3, 3)))
+    else:
+        bench('vrp_21.txt', *vrp.read_vrp(vrp.loader.load_instance('vrp_21.txt', 3, 3)))
+        for n in [200, 1000, 3000]:
+            bench('random', *gen_vrp(n))